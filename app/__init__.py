@@ -1,6 +1,11 @@
 from flask import Flask
 from app.config import load_configurations, configure_logging
 from .views import webhook_blueprint
+from .utils.message_queue import init_message_queue
+from .utils.dedup import init_deduplicator
+from .utils.whatsapp_utils import process_whatsapp_message, process_image_message
+from .services.thread_store import init_thread_store
+from .services.modules.forecast_store import init_forecast_refresher
 
 
 def create_app():
@@ -13,4 +18,19 @@ def create_app():
     # Import and register blueprints, if any
     app.register_blueprint(webhook_blueprint)
 
+    # Import the legacy threads_db shelve the first time the thread store is used
+    init_thread_store(app)
+
+    # Drop webhook events Meta redelivers
+    init_deduplicator(app)
+
+    # Start the workers that process incoming messages outside the webhook request
+    init_message_queue(
+        app,
+        handlers={"text": process_whatsapp_message, "image": process_image_message},
+    )
+
+    # Keep the sales forecasts precomputed for the current sales data
+    init_forecast_refresher(app)
+
     return app
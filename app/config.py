@@ -13,6 +13,29 @@ def load_configurations(app):
     app.config["VERSION"] = os.environ["VERSION"]
     app.config["PHONE_NUMBER_ID"] = os.environ["PHONE_NUMBER_ID"]
     app.config["VERIFY_TOKEN"] = os.environ["VERIFY_TOKEN"]
+    # Bearer token for /queue/stats; the endpoint is disabled when unset
+    app.config["STATS_TOKEN"] = os.environ.get("STATS_TOKEN", "")
+
+    # Background message processing queue
+    app.config["MESSAGE_QUEUE_BACKEND"] = os.environ.get("MESSAGE_QUEUE_BACKEND", "memory")
+    app.config["MESSAGE_QUEUE_PATH"] = os.environ.get("MESSAGE_QUEUE_PATH", "message_queue.db")
+    app.config["MESSAGE_QUEUE_WORKERS"] = int(os.environ.get("MESSAGE_QUEUE_WORKERS", 4))
+    app.config["MESSAGE_QUEUE_MAXSIZE"] = int(os.environ.get("MESSAGE_QUEUE_MAXSIZE", 1000))
+
+    # Deduplication of redelivered webhook events
+    app.config["DEDUP_BACKEND"] = os.environ.get("DEDUP_BACKEND", "memory")
+    app.config["DEDUP_PATH"] = os.environ.get("DEDUP_PATH", "dedup.db")
+    app.config["DEDUP_TTL_SECONDS"] = int(os.environ.get("DEDUP_TTL_SECONDS", 86400))
+    app.config["DEDUP_MAX_ENTRIES"] = int(os.environ.get("DEDUP_MAX_ENTRIES", 100000))
+
+    # Downloaded media: largest accepted file, and size above which it is spilled to a temporary file.
+    # Media stays in memory by default; set MEDIA_SPOOL_BYTES below MEDIA_MAX_BYTES to enable spilling
+    app.config["MEDIA_MAX_BYTES"] = int(os.environ.get("MEDIA_MAX_BYTES", 5 * 1024 * 1024))
+    app.config["MEDIA_SPOOL_BYTES"] = int(os.environ.get("MEDIA_SPOOL_BYTES", app.config["MEDIA_MAX_BYTES"]))
+
+    # Seconds between checks for new sales data to refit the stored forecasts; 0 turns the refresher
+    # off when `python -m app.services.modules.forecast_store` runs as a scheduled job instead
+    app.config["FORECAST_REFRESH_INTERVAL"] = int(os.environ.get("FORECAST_REFRESH_INTERVAL", 600))
 
 
 def configure_logging():
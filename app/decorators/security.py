@@ -36,3 +36,23 @@ def signature_required(f):
         return f(*args, **kwargs)
 
     return decorated_function
+
+
+def stats_token_required(f):
+    """
+    Decorator to restrict the internal stats endpoints to requests carrying the STATS_TOKEN bearer token.
+    """
+
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        expected_token = current_app.config.get("STATS_TOKEN")
+        # Without a configured token the endpoints are disabled
+        if not expected_token:
+            return jsonify({"status": "error", "message": "Not found"}), 404
+        token = request.headers.get("Authorization", "").removeprefix("Bearer ")
+        if not hmac.compare_digest(token.encode("utf-8"), expected_token.encode("utf-8")):
+            logging.info("Stats token verification failed!")
+            return jsonify({"status": "error", "message": "Invalid token"}), 403
+        return f(*args, **kwargs)
+
+    return decorated_function
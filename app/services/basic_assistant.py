@@ -2,11 +2,17 @@ import os
 import json
 import time
 import logging
+import fcntl
 import shelve
+import threading
+import concurrent.futures
 from datetime import datetime
+from collections import deque
+from contextlib import contextmanager
 from openai import OpenAI
 from dotenv import find_dotenv, load_dotenv
 from app.services.functions import assistant_functions, available_functions_dict
+from app.services.thread_store import thread_store
 
 
 # Load environment variables, initialize the OpenAI client with API key, and retrieve the available functions dictionary.
@@ -20,6 +26,29 @@ instructions = f"Eres un asistente especializado en ayudar tiendas pequeñas de
 name="Asistente Personal de Abarrotes"
 model="gpt-4o"
 
+# "stream" consumes run events as they arrive, "poll" retrieves the run status in a loop.
+run_mode = os.environ.get("ASSISTANT_RUN_MODE", "stream")
+# Timings of the most recent runs
+run_metrics = deque(maxlen=200)
+
+# Pool shared by all runs to execute tool calls concurrently, with per-tool timeouts in seconds.
+tool_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=int(os.environ.get("TOOL_CALL_WORKERS", 4)),
+    thread_name_prefix="tool-call",
+)
+default_tool_timeout = float(os.environ.get("TOOL_CALL_TIMEOUT", 30))
+# Longest a call may wait for a free worker before it is cancelled; its own timeout starts once it runs
+tool_queue_timeout = float(os.environ.get("TOOL_CALL_QUEUE_TIMEOUT", 30))
+tool_timeouts = {
+    "forecast_sales": 60,
+    "predict_inventory_depletion": 60,
+    "recommend_products_for": 60,
+}
+
+# Assistant ID for the current date, so the hot path never opens assistants_db
+assistant_cache = {}
+assistant_lock = threading.Lock()
+
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -42,51 +71,230 @@ def store_assistant(current_date, assistant_id):
         logging.error(f"Error storing assistant ID in database: {e}")
 
 
-def check_if_thread_exists(wa_id):
-    # Check if there is an existing thread ID for the given WhatsApp ID using shelve.
-    try:
-        with shelve.open("threads_db") as threads_shelf:
-            return threads_shelf.get(wa_id, None)
-    except Exception as e:
-        logging.error(f"Error accessing threads database: {e}")
-        return None
+@contextmanager
+def assistants_file_lock():
+    # Exclusive lock shared by every worker process, held while the assistant for a date is created.
+    with open("assistants_db.lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
 
-def store_thread(wa_id, thread_id):
-    # Store a new thread ID for the given WhatsApp ID using shelve.
+def get_assistant_id(current_date, full_instructions):
+    # Resolve today's assistant from memory; only the first message of the day in each process reads
+    # the shelve, and only one process in the cluster creates the assistant.
+    assistant_id = assistant_cache.get(current_date)
+    if assistant_id:
+        return assistant_id
+
+    with assistant_lock:
+        assistant_id = assistant_cache.get(current_date)
+        if assistant_id:
+            return assistant_id
+
+        with assistants_file_lock():
+            assistant_id = check_if_assistant_exists(current_date)
+            if not assistant_id:
+                logging.info("Creating new assistant as none exists for today's date.")
+                assistant = client.beta.assistants.create(
+                    name=name,
+                    model=model,
+                    instructions=full_instructions,
+                    tools=assistant_functions
+                    )
+                assistant_id = assistant.id
+                store_assistant(current_date, assistant_id)
+                logging.info(f"New assistant created and stored with ID {assistant_id} for date {current_date}.")
+
+        # Previous dates are no longer needed after the date rolls over
+        assistant_cache.clear()
+        assistant_cache[current_date] = assistant_id
+        return assistant_id
+
+
+def timed_tool_call(function_name, function_to_call, function_args, begun):
+    # Run a single tool and log how long it took. `begun` records when a pool worker picked it up.
+    begun["at"] = time.monotonic()
+    begun["event"].set()
+    if begun["at"] > begun["queue_deadline"]:
+        # Its output was already reported as a timeout
+        raise concurrent.futures.TimeoutError()
+    started = time.perf_counter()
     try:
-        with shelve.open("threads_db", writeback=True) as threads_shelf:
-            threads_shelf[wa_id] = thread_id
-    except Exception as e:
-        logging.error(f"Error storing thread ID in database: {e}")
+        return function_to_call(**function_args)
+    finally:
+        logging.info(f"Tool {function_name} finished in {time.perf_counter() - started:.2f}s.")
 
 
 def handle_tool_calls(tool_calls):
+    # Independent tool calls run concurrently on a bounded pool. Every call gets an output,
+    # so a tool that fails or times out yields an error message instead of blocking the others.
+    started = time.perf_counter()
+    futures = []
     tool_outputs = []
     for tool_call in tool_calls:
         function_name = tool_call.function.name
         function_to_call = available_functions.get(function_name)
 
-        if function_to_call and tool_call.function.arguments:
-            logging.info(f"Arguments for {function_name}: {tool_call.function.arguments}")
-            try:
-                function_args = json.loads(tool_call.function.arguments)
-                function_response = function_to_call(**function_args)
-                tool_outputs.append({
-                    "tool_call_id": tool_call.id,
-                    "output": function_response
-                })
-            except json.JSONDecodeError:
-                logging.error(f"Invalid JSON arguments for tool call {function_name}")
-                continue
-            except KeyError as e:
-                logging.error(f"Missing function argument: {e}")
-                continue
-            except Exception as e:
-                logging.error(f"Unexpected error during function call: {e}")
-                continue
+        if not function_to_call:
+            logging.error(f"Unknown tool call {function_name}")
+            tool_outputs.append({"tool_call_id": tool_call.id, "output": f"Function {function_name} is not available."})
+            continue
+
+        logging.info(f"Arguments for {function_name}: {tool_call.function.arguments}")
+        try:
+            function_args = json.loads(tool_call.function.arguments or "{}")
+        except json.JSONDecodeError:
+            logging.error(f"Invalid JSON arguments for tool call {function_name}")
+            tool_outputs.append({"tool_call_id": tool_call.id, "output": f"Invalid arguments for {function_name}."})
+            continue
+
+        begun = {"event": threading.Event(), "at": None, "queue_deadline": time.monotonic() + tool_queue_timeout}
+        future = tool_executor.submit(timed_tool_call, function_name, function_to_call, function_args, begun)
+        futures.append((tool_call, future, begun))
+
+    for tool_call, future, begun in futures:
+        function_name = tool_call.function.name
+        timeout = tool_timeouts.get(function_name, default_tool_timeout)
+        try:
+            # Time spent waiting for a free worker is not charged to the tool's timeout
+            if not begun["event"].wait(timeout=max(0, begun["queue_deadline"] - time.monotonic())):
+                raise concurrent.futures.TimeoutError()
+            function_response = future.result(timeout=max(0, begun["at"] + timeout - time.monotonic()))
+        except concurrent.futures.TimeoutError:
+            # A call that has not started yet is dropped so it does not run after its output was reported
+            if future.cancel() or begun["at"] is None or begun["at"] > begun["queue_deadline"]:
+                logging.error(f"Tool call {function_name} timed out waiting for a free worker")
+            else:
+                logging.error(f"Tool call {function_name} timed out")
+            function_response = f"The function {function_name} took too long to respond."
+        except TypeError as e:
+            logging.error(f"Invalid function arguments for {function_name}: {e}")
+            function_response = f"Invalid arguments for {function_name}."
+        except KeyError as e:
+            logging.error(f"Missing function argument: {e}")
+            function_response = f"Missing argument for {function_name}: {e}"
+        except Exception as e:
+            logging.error(f"Unexpected error during function call: {e}")
+            function_response = f"An error occurred in {function_name}: {e}"
+        tool_outputs.append({
+            "tool_call_id": tool_call.id,
+            "output": function_response
+        })
+
+    logging.info(f"Handled {len(tool_calls)} tool calls in {time.perf_counter() - started:.2f}s.")
     return tool_outputs
 
 
+def record_run_metrics(thread_id, mode, started, first_token_at, tool_rounds):
+    # Keep timings of recent runs and log them for each request.
+    total_time = time.perf_counter() - started
+    time_to_first_token = first_token_at - started if first_token_at is not None else None
+    metrics = {
+        "thread_id": thread_id,
+        "mode": mode,
+        "time_to_first_token": time_to_first_token,
+        "total_time": total_time,
+        "tool_rounds": tool_rounds,
+    }
+    run_metrics.append(metrics)
+    ttft = f"{time_to_first_token:.2f}s" if time_to_first_token is not None else "n/a"
+    logging.info(f"Run metrics ({mode}): time to first token {ttft}, total {total_time:.2f}s, {tool_rounds} tool rounds.")
+    return metrics
+
+
+def stream_run(thread_id, assistant_id):
+    # Run the assistant consuming server-sent events as they arrive. Tool calls are dispatched
+    # as soon as a requires_action event shows up, for as many rounds as the run needs.
+    started = time.perf_counter()
+    first_token_at = None
+    tool_rounds = 0
+    new_message = None
+
+    stream = client.beta.threads.runs.create(
+        thread_id=thread_id,
+        assistant_id=assistant_id,
+        stream=True,
+    )
+    logging.info(f"Assistant run streaming for thread {thread_id}.")
+    while stream is not None:
+        required_action_run = None
+        with stream:
+            for event in stream:
+                if event.event == "thread.message.delta":
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                elif event.event == "thread.message.completed":
+                    new_message = event.data.content[0].text.value
+                elif event.event == "thread.run.requires_action":
+                    required_action_run = event.data
+                elif event.event in ("thread.run.failed", "thread.run.cancelled", "thread.run.expired", "thread.run.incomplete"):
+                    logging.error(f"Run ended with status {event.data.status}: {event.data.last_error or event.data.incomplete_details}")
+                    record_run_metrics(thread_id, "stream", started, first_token_at, tool_rounds)
+                    return None
+                elif event.event == "error":
+                    logging.error(f"Run stream error: {event.data}")
+                    record_run_metrics(thread_id, "stream", started, first_token_at, tool_rounds)
+                    return None
+
+        stream = None
+        if required_action_run is not None:
+            tool_rounds += 1
+            logging.info(f"Handling required actions for the assistant run (round {tool_rounds}).")
+            tool_calls = required_action_run.required_action.submit_tool_outputs.tool_calls
+            tool_outputs = handle_tool_calls(tool_calls)
+            logging.info(f"Submitting tool outputs: {tool_outputs}")
+            stream = client.beta.threads.runs.submit_tool_outputs(
+                thread_id=thread_id,
+                run_id=required_action_run.id,
+                tool_outputs=tool_outputs,
+                stream=True,
+            )
+
+    record_run_metrics(thread_id, "stream", started, first_token_at, tool_rounds)
+    return new_message
+
+
+def poll_run(thread_id, assistant_id):
+    # Run the assistant polling its status until it completes.
+    started = time.perf_counter()
+    tool_rounds = 0
+    run = client.beta.threads.runs.create(
+        thread_id=thread_id,
+        assistant_id=assistant_id,
+    )
+    logging.info(f"Assistant run initiated for thread {thread_id}.")
+    while run.status != 'completed':
+        if run.status in ['failed', 'cancelled', 'expired', 'incomplete']:
+            logging.error(f"Run ended with status {run.status}: {run.last_error or run.incomplete_details}")
+            record_run_metrics(thread_id, "poll", started, None, tool_rounds)
+            return None
+
+        if run.status == 'requires_action':
+            tool_rounds += 1
+            logging.info(f"Handling required actions for the assistant run (round {tool_rounds}).")
+            tool_calls = run.required_action.submit_tool_outputs.tool_calls
+            tool_outputs = handle_tool_calls(tool_calls)
+            logging.info(f"Submitting tool outputs: {tool_outputs}")
+            run = client.beta.threads.runs.submit_tool_outputs(
+                thread_id=thread_id,
+                run_id=run.id,
+                tool_outputs=tool_outputs
+            )
+            continue
+
+        logging.info(f"Run status: {run.status}, sleeping for 0.5 seconds.")
+        time.sleep(0.5)
+        run = client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run.id)
+
+    logging.info("Retrieving messages from the thread.")
+    messages = client.beta.threads.messages.list(thread_id=thread_id)
+    record_run_metrics(thread_id, "poll", started, None, tool_rounds)
+    return messages.data[0].content[0].text.value
+
+
 def run_assistant(message_body, thread_id):
     # Update the current date each time the function runs
     current_date = datetime.now().strftime("%Y-%m-%d")
@@ -95,18 +303,7 @@ def run_assistant(message_body, thread_id):
 
     # Add user message to the thread and run the assistant.
     try:
-        logging.info("Creating new assistant as none exists for today's date.")
-        assistant_id = check_if_assistant_exists(current_date)
-        if not assistant_id:
-            assistant = client.beta.assistants.create(
-                name=name,
-                model=model,
-                instructions=full_instructions,
-                tools=assistant_functions
-                )
-            assistant_id = assistant.id
-            store_assistant(current_date, assistant_id)
-            logging.info(f"New assistant created and stored with ID {assistant_id} for date {current_date}.")
+        assistant_id = get_assistant_id(current_date, full_instructions)
 
         client.beta.threads.messages.create(
             thread_id=thread_id,
@@ -114,39 +311,16 @@ def run_assistant(message_body, thread_id):
             content=message_body,
         )
         logging.info("User message added to the thread.")
-        run = client.beta.threads.runs.create(
-            thread_id=thread_id,
-            assistant_id=assistant_id,
-        )
-        logging.info(f"Assistant run initiated for thread {thread_id}.")
-        while run.status not in ['completed', 'requires_action', 'failed']:
-            logging.info(f"Run status: {run.status}, sleeping for 1 second.")
-            time.sleep(0.5)
-            run = client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run.id)
-            logging.info(f"Run status: {run.status}")
-        
-        if run.status == 'failed':
+
+        if run_mode == "stream":
+            new_message = stream_run(thread_id, assistant_id)
+        else:
+            new_message = poll_run(thread_id, assistant_id)
+
+        if new_message is None:
             logging.error("Run failed, please try again.")
             return "The assistant encountered an error and could not complete the request. Please try again."
 
-        if run.status == 'requires_action':
-            logging.info("Handling required actions for the assistant run.")
-            tool_calls = run.required_action.submit_tool_outputs.tool_calls
-            tool_outputs = handle_tool_calls(tool_calls)
-            logging.info(f"Submitting tool outputs: {tool_outputs}")
-            client.beta.threads.runs.submit_tool_outputs(
-                thread_id=thread_id,
-                run_id=run.id,
-                tool_outputs=tool_outputs
-            )
-        while run.status != 'completed':
-            logging.info(f"Run status: {run.status}, sleeping for 1 second.")
-            time.sleep(0.5)
-            run = client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run.id)
-
-        logging.info("Retrieving messages from the thread.")
-        messages = client.beta.threads.messages.list(thread_id=thread_id)
-        new_message = messages.data[0].content[0].text.value
         logging.info(f"Generated message: {new_message}")
         return new_message
     
@@ -157,16 +331,10 @@ def run_assistant(message_body, thread_id):
 
 def generate_response(message_body, wa_id):
     # Generate a response using an existing or new thread based on WhatsApp ID.
-    thread_id = check_if_thread_exists(wa_id)
-    if thread_id is None:
-        logging.info(f"Creating new thread for wa_id: {wa_id}")
-        try:
-            thread = client.beta.threads.create()
-            store_thread(wa_id, thread.id)
-            thread_id = thread.id
-        except Exception as e:
-            logging.error(f"Error creating new thread: {e}")
-            return "Failed to initiate conversation."
+    try:
+        thread_id = thread_store.get_or_create(wa_id, lambda: client.beta.threads.create().id)
+    except Exception as e:
+        logging.error(f"Error creating new thread: {e}")
+        return "Failed to initiate conversation."
 
     return run_assistant(message_body, thread_id)
-
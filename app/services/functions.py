@@ -4,7 +4,7 @@ from app.services.modules.clock import get_current_time
 from app.services.modules.recomendacion_grafos import recommend_products_for
 from app.services.modules.get_financial_metric import get_financial_metric
 from app.services.modules.send_income_statement import get_income_statement_link
-from app.services.modules.predict_sales import forecast_sales, predict_inventory_depletion
+from app.services.modules.predict_sales import forecast_sales, predict_inventory_depletion, products_running_out
 from app.services.modules.inventory_management import calculate_inventory_metrics
 from app.services.modules.confirm_ticket import update_tickets_csv
 from app.services.modules.lead_time import save_lead_time
@@ -158,6 +158,21 @@ predict_sales_functions = [
                 "required": ["product", "threshold_inventory"]
             }
         }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "products_running_out",
+            "description": "List the products whose inventory will run out (or fall to a threshold) within the next days, e.g. which products run out this week.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "days": {"type": "integer", "description": "Number of days ahead to check. Use 7 for this week."},
+                    "threshold_inventory": {"type": "integer", "description": "Inventory level considered as running out. Use 0 unless the user gives one."}
+                },
+                "required": ["days"]
+            }
+        }
     }
 ]
 
@@ -248,7 +263,8 @@ send_income_statement_functions_dict = {
 
 predict_sales_functions_dict = {
     "forecast_sales": forecast_sales,
-    "predict_inventory_depletion": predict_inventory_depletion
+    "predict_inventory_depletion": predict_inventory_depletion,
+    "products_running_out": products_running_out
 
 }
 
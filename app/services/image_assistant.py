@@ -1,14 +1,17 @@
+import io
 import os
 import logging
-import shelve
 import time
 import base64
 import json
+import argparse
 import requests
 from openai import OpenAI
 from dotenv import find_dotenv, load_dotenv
-from app.services.modules.vectors import get_product_name
-from app.services.modules.products_dictionary import products_dictionary
+from app.services.modules.product_matcher import match_products
+from app.services.modules.image_preprocessing import preprocess_image
+from app.services.thread_store import thread_store
+from app.services.modules.catalog import get_catalog
 from datetime import datetime
 
 # Load environment variables and initialize the OpenAI client with the API key
@@ -20,16 +23,19 @@ client = OpenAI(api_key=OPENAI_API_KEY)
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # Function to encode the image
-def encode_image(image_path):
+def encode_image(image_file):
     try:
-        with open(image_path, "rb") as image_file:
-            return base64.b64encode(image_file.read()).decode('utf-8')
+        if isinstance(image_file, io.BytesIO):
+            # Encode straight from the download buffer without copying it first
+            return base64.b64encode(image_file.getbuffer()).decode('ascii')
+        image_file.seek(0)
+        return base64.b64encode(image_file.read()).decode('ascii')
     except Exception as e:
         logging.error(f"Error encoding image: {e}")
         return None
 
-def create_sales_ticket(image_path, image_id):
-    base64_image = encode_image(image_path)
+def create_sales_ticket(image_file, image_id):
+    base64_image = encode_image(image_file)
     if not base64_image:
         return "Error encoding image."
 
@@ -88,14 +94,18 @@ def format_ticket(json_response):
         data = json.loads(json_response)
         products = data['productos']
 
+        catalog = get_catalog()
         total_cost = 0
         processed_products = []
 
-        for product in products:
+        # Resolve every line item of the ticket in one batch
+        matches = match_products([product['nombre_producto'] for product in products])
+
+        for product, (actual_product_name, score, tier) in zip(products, matches):
             product_string = product['nombre_producto']
             amount = product['cantidad']
-            actual_product_name = get_product_name(product_string)
-            product_cost = products_dictionary.get(actual_product_name, 0)
+            logging.info(f"Matched '{product_string}' to '{actual_product_name}' ({tier}, score {score:.3f})")
+            product_cost = catalog.price(actual_product_name, 0)
             total_product_cost = product_cost * amount
             total_cost += total_product_cost
             processed_products.append({
@@ -135,66 +145,55 @@ def format_ticket(json_response):
         logging.error(f"JSON decoding error: {e}")
         return "Error processing ticket."
 
-def create_new_assistant():
-    try:
-        assistant = client.beta.assistants.create(
-            name="Echo Assistant",
-            model="gpt-4o",
-            instructions="You are an echo assistant. Return exactly the same text you receive as input."
-        )
-        return assistant.id
-    except Exception as e:
-        logging.error(f"Error creating a new assistant: {e}")
-        return None
-
 def get_or_create_thread(wa_id):
     try:
-        with shelve.open("threads_db", writeback=True) as threads_shelf:
-            thread_id = threads_shelf.get(wa_id)
-            if not thread_id:
-                thread = client.beta.threads.create()
-                threads_shelf[wa_id] = thread.id
-                thread_id = thread.id
-        return thread_id
+        return thread_store.get_or_create(wa_id, lambda: client.beta.threads.create().id)
     except Exception as e:
         logging.error(f"Error accessing or creating the thread: {e}")
         return None
 
-def echo_text(input_text, wa_id):
+def add_to_thread_history(text, wa_id):
+    # Append the ticket to the user's thread as an assistant message, so the text assistant
+    # sees it in later turns without a run.
     try:
         thread_id = get_or_create_thread(wa_id)
-        assistant_id = create_new_assistant()
-        if not assistant_id:
-            return "Error creating assistant."
-
-        client.beta.threads.messages.create(
+        if not thread_id:
+            return None
+        return client.beta.threads.messages.create(
             thread_id=thread_id,
-            role="user",
-            content=[
-                {"type": "text", "text": input_text}
-            ],
+            role="assistant",
+            content=text,
         )
+    except Exception as e:
+        logging.error(f"Could not add the ticket to the thread history: {e}")
+        return None
 
-        run = client.beta.threads.runs.create(
-            thread_id=thread_id,
-            assistant_id=assistant_id,
-        )
-        while run.status not in ['completed', 'requires_action']:
-            time.sleep(0.5)
-            run = client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run.id)
+def delete_echo_assistants(dry_run=False):
+    # Removes the "Echo Assistant" assistants the old echo path created for every image.
+    # Collect the ids first; deleting while paging would invalidate the list cursor
+    echo_ids = [assistant.id for assistant in client.beta.assistants.list(limit=100) if assistant.name == "Echo Assistant"]
+    if not dry_run:
+        for assistant_id in echo_ids:
+            client.beta.assistants.delete(assistant_id)
+    return len(echo_ids)
 
-        messages = client.beta.threads.messages.list(thread_id=thread_id)
-        return messages
-    except Exception as e:
-        logging.error(f"An error occurred: {e}")
-        return f"An error occurred: {e}"
-    
-def generate_image_response(image_path, wa_id, image_id):
+def generate_image_response(image_file, wa_id, image_id):
     try:
-        sales_ticket = create_sales_ticket(image_path, image_id)
+        start = time.perf_counter()
+        image_file = preprocess_image(image_file)
+        sales_ticket = create_sales_ticket(image_file, image_id)
+        logging.info(f"Sales ticket {image_id} extracted in {time.perf_counter() - start:.2f}s (preprocessing + vision request).")
         formatted_ticket = format_ticket(sales_ticket)
         
         return formatted_ticket
     except Exception as e:
         logging.error(f"An error occurred in generate_image_response: {e}")
         return f"An error occurred: {e}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Delete the orphaned echo assistants.")
+    parser.add_argument("--dry-run", action="store_true", help="only count them")
+    args = parser.parse_args()
+    count = delete_echo_assistants(dry_run=args.dry_run)
+    print(f"{'Found' if args.dry_run else 'Deleted'} {count} echo assistants.")
@@ -0,0 +1,203 @@
+import io
+import os
+import json
+import time
+import logging
+import threading
+from urllib.parse import quote
+import pandas as pd
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceNotModifiedError
+from azure.storage.blob import BlobServiceClient
+from dotenv import find_dotenv, load_dotenv
+from app.utils.files import atomic_write
+
+
+load_dotenv(find_dotenv())
+SAS_TOKEN = os.environ["SAS_TOKEN"]
+
+account_name = "pythonwhatsappbotstorage"
+container_name = "data"
+sas_token = SAS_TOKEN
+
+
+class BlobCache:
+    """
+    Read-through cache for the blobs in the data container.
+
+    Blobs are kept in memory and on disk together with their ETag. Once `revalidate_seconds`
+    have passed, the next read asks Azure for the blob only if its ETag changed, so an
+    unchanged blob is never downloaded again, not even after a restart.
+    """
+
+    def __init__(self, account_url, container_name, credential, cache_dir=".blob_cache", revalidate_seconds=30):
+        self.account_url = account_url
+        self.container_name = container_name
+        self.credential = credential
+        self.cache_dir = cache_dir
+        self.revalidate_seconds = revalidate_seconds
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "not_modified": 0, "downloads": 0, "errors": 0}
+        self._entries = {}
+        self._container_client = None
+        self._lock = threading.Lock()
+        self._blob_locks = {}
+
+    @property
+    def container_client(self):
+        # One client (and connection pool) for every blob and every tool
+        if self._container_client is None:
+            service_client = BlobServiceClient(account_url=self.account_url, credential=self.credential)
+            self._container_client = service_client.get_container_client(self.container_name)
+        return self._container_client
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _blob_lock(self, blob_name):
+        with self._lock:
+            return self._blob_locks.setdefault(blob_name, threading.Lock())
+
+    def path_for(self, blob_name):
+        return os.path.join(self.cache_dir, quote(blob_name, safe=""))
+
+    def _load_from_disk(self, blob_name):
+        path = self.path_for(blob_name)
+        try:
+            with open(f"{path}.meta", "r") as meta_file:
+                meta = json.load(meta_file)
+            with open(path, "rb") as data_file:
+                data = data_file.read()
+        except (OSError, ValueError):
+            return None
+        self._count("disk_hits")
+        return {"etag": meta["etag"], "last_modified": meta.get("last_modified"), "data": data, "checked_at": 0}
+
+    def _save_to_disk(self, blob_name, entry):
+        path = self.path_for(blob_name)
+        with atomic_write(path) as data_file:
+            data_file.write(entry["data"])
+        with atomic_write(f"{path}.meta", "w") as meta_file:
+            json.dump({"etag": entry["etag"], "last_modified": entry["last_modified"]}, meta_file)
+
+    def _download(self, blob_name, entry):
+        blob_client = self.container_client.get_blob_client(blob_name)
+        try:
+            if entry is not None:
+                downloader = blob_client.download_blob(etag=entry["etag"], match_condition=MatchConditions.IfModified)
+            else:
+                downloader = blob_client.download_blob()
+        except ResourceNotModifiedError:
+            self._count("not_modified")
+            entry["checked_at"] = time.monotonic()
+            return entry
+
+        data = downloader.readall()
+        self._count("downloads")
+        last_modified = downloader.properties.last_modified
+        new_entry = {
+            "etag": downloader.properties.etag,
+            "last_modified": last_modified.isoformat() if last_modified else None,
+            "data": data,
+            "checked_at": time.monotonic(),
+        }
+        self._save_to_disk(blob_name, new_entry)
+        return new_entry
+
+    def fetch(self, blob_name):
+        # Returns the cache entry for a blob, revalidating it against Azure when it is due.
+        entry = self._entries.get(blob_name)
+        if entry is not None and time.monotonic() - entry["checked_at"] < self.revalidate_seconds:
+            self._count("memory_hits")
+            return entry
+
+        with self._blob_lock(blob_name):
+            entry = self._entries.get(blob_name)
+            if entry is not None and time.monotonic() - entry["checked_at"] < self.revalidate_seconds:
+                self._count("memory_hits")
+                return entry
+            if entry is None:
+                entry = self._load_from_disk(blob_name)
+            try:
+                entry = self._download(blob_name, entry)
+            except Exception as e:
+                self._count("errors")
+                if entry is None:
+                    raise
+                # Azure is unreachable, serve the last known copy
+                logging.error(f"Could not revalidate blob {blob_name}, using cached copy: {e}")
+            self._entries[blob_name] = entry
+            return entry
+
+    def get_bytes(self, blob_name):
+        return self.fetch(blob_name)["data"]
+
+    def get_version(self, blob_name):
+        return self.fetch(blob_name)["etag"]
+
+    def get_path(self, blob_name):
+        # Local path of the cached copy, for libraries that need a file instead of bytes.
+        self.fetch(blob_name)
+        return self.path_for(blob_name)
+
+    def upload_file(self, file_path, blob_name):
+        with open(file_path, "rb") as data_file:
+            data = data_file.read()
+        result = self.container_client.get_blob_client(blob_name).upload_blob(data, overwrite=True)
+        last_modified = result.get("last_modified")
+        entry = {
+            "etag": result.get("etag"),
+            "last_modified": last_modified.isoformat() if last_modified else None,
+            "data": data,
+            "checked_at": time.monotonic(),
+        }
+        with self._blob_lock(blob_name):
+            self._save_to_disk(blob_name, entry)
+            self._entries[blob_name] = entry
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.counters)
+
+
+blob_cache = BlobCache(
+    f"https://{account_name}.blob.core.windows.net",
+    container_name,
+    sas_token,
+    cache_dir=os.environ.get("BLOB_CACHE_DIR", ".blob_cache"),
+    revalidate_seconds=float(os.environ.get("BLOB_CACHE_REVALIDATE_SECONDS", 30)),
+)
+
+
+def read_excel_blob(blob_name, **kwargs):
+    try:
+        return pd.read_excel(io.BytesIO(blob_cache.get_bytes(blob_name)), **kwargs)
+    except Exception as e:
+        # Handle generic exceptions which could be related to Azure access issues, network problems, etc.
+        logging.error(f"Failed to load {blob_name} from Azure Blob Storage: {e}")
+        return None
+
+
+def read_csv_blob(blob_name, **kwargs):
+    try:
+        return pd.read_csv(io.BytesIO(blob_cache.get_bytes(blob_name)), **kwargs)
+    except Exception as e:
+        logging.error(f"Failed to load {blob_name} from Azure Blob Storage: {e}")
+        return None
+
+
+def get_blob_path(blob_name):
+    try:
+        return blob_cache.get_path(blob_name)
+    except Exception as e:
+        logging.error(f"Failed to load {blob_name} from Azure Blob Storage: {e}")
+        return None
+
+
+def upload_file_to_blob(file_path, blob_name):
+    try:
+        print(f"Uploading to Azure Storage as blob:\n\t{blob_name}")
+        blob_cache.upload_file(file_path, blob_name)
+        return f"File {file_path} uploaded to Azure Blob Storage successfully as {blob_name}."
+    except Exception as ex:
+        return f"An error occurred: {ex}"
@@ -0,0 +1,181 @@
+import os
+import sys
+import csv
+import time
+import logging
+import argparse
+import threading
+import numpy as np
+from app.services.modules.name_index import NameIndex, normalize_name
+from app.utils.lazy import LazyValue
+from app.utils.files import atomic_write
+
+
+catalog_path = os.environ.get("PRODUCT_CATALOG_PATH", os.path.join(os.path.dirname(__file__), "catalog.npz"))
+
+
+def pack_strings(strings):
+    # Strings as one UTF-8 buffer plus offsets, instead of a fixed-width unicode array.
+    encoded = [string.encode("utf-8") for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(item) for item in encoded])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def unpack_strings(buffer, offsets):
+    data = buffer.tobytes()
+    return [sys.intern(data[start:end].decode("utf-8")) for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+
+
+class Catalog:
+    """
+    Product catalog: id, canonical name and price per product, plus aliases.
+
+    Prices are kept in a NumPy array and names are looked up through one dict of interned
+    strings, so the whole catalog costs a few arrays per worker instead of thousands of
+    dicts. Lookups accept the canonical name, an alias, or a string that only differs in
+    accents, case or punctuation.
+    """
+
+    def __init__(self, ids, names, prices, aliases=None):
+        self.ids = list(ids)
+        self.names = list(names)
+        self.prices = np.asarray(prices, dtype=np.float64)
+        self.positions = {name: i for i, name in enumerate(self.names)}
+        self.aliases = {alias: name for alias, name in (aliases or {}).items() if name in self.positions}
+        for alias, name in self.aliases.items():
+            self.positions.setdefault(alias, self.positions[name])
+        self._normalized_positions = None
+        self._name_index = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return self.position(name) is not None
+
+    @property
+    def name_index(self):
+        with self._lock:
+            if self._name_index is None:
+                self._name_index = NameIndex(self.names)
+            return self._name_index
+
+    @property
+    def normalized_positions(self):
+        # Built on the first lookup that misses the exact names, which keeps loading cheap
+        with self._lock:
+            if self._normalized_positions is None:
+                normalized_positions = {}
+                for name, i in self.positions.items():
+                    normalized_positions.setdefault(normalize_name(name), i)
+                self._normalized_positions = normalized_positions
+            return self._normalized_positions
+
+    def position(self, name):
+        if name is None:
+            return None
+        i = self.positions.get(name)
+        if i is None:
+            i = self.normalized_positions.get(normalize_name(name))
+        return i
+
+    def price(self, name, default=None):
+        i = self.position(name)
+        return float(self.prices[i]) if i is not None else default
+
+    def product_id(self, name, default=None):
+        i = self.position(name)
+        return self.ids[i] if i is not None else default
+
+    def save(self, path):
+        ids, id_offsets = pack_strings(self.ids)
+        names, name_offsets = pack_strings(self.names)
+        aliases, alias_offsets = pack_strings(list(self.aliases))
+        alias_targets = np.array([self.positions[name] for name in self.aliases.values()], dtype=np.int32)
+        with atomic_write(path) as catalog_file:
+            np.savez_compressed(
+                catalog_file,
+                ids=ids, id_offsets=id_offsets,
+                names=names, name_offsets=name_offsets,
+                prices=self.prices,
+                aliases=aliases, alias_offsets=alias_offsets, alias_targets=alias_targets,
+            )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as stored:
+            names = unpack_strings(stored["names"], stored["name_offsets"])
+            aliases = unpack_strings(stored["aliases"], stored["alias_offsets"])
+            return cls(
+                ids=unpack_strings(stored["ids"], stored["id_offsets"]),
+                names=names,
+                prices=stored["prices"],
+                aliases={alias: names[i] for alias, i in zip(aliases, stored["alias_targets"].tolist())},
+            )
+
+
+def build_catalog(aliases_path=None):
+    # Converts the products_dictionary and products_info modules into a single catalog.
+    from app.services.modules.products_dictionary import products_dictionary
+    from app.services.modules.products_info import products_info
+
+    ids, names, prices = [], [], []
+    for name, info in products_info.items():
+        ids.append(info["product_id"])
+        names.append(name)
+        prices.append(info["unit_price"])
+    for i, (name, price) in enumerate(products_dictionary.items()):
+        if name in products_info:
+            continue
+        ids.append(f"D{i + 1:04d}")
+        names.append(name)
+        prices.append(price)
+
+    aliases = {}
+    if aliases_path:
+        # CSV with "alias,name" rows
+        with open(aliases_path, newline="", encoding="utf-8") as aliases_file:
+            for row in csv.reader(aliases_file):
+                if len(row) >= 2 and row[0] and row[1]:
+                    aliases[row[0]] = row[1]
+    return Catalog(ids, names, prices, aliases)
+
+
+def load_catalog(_previous=None):
+    # Converted from the Python modules if the catalog file is missing.
+    try:
+        return Catalog.load(catalog_path)
+    except (OSError, ValueError, KeyError) as e:
+        logging.warning(f"Could not load product catalog from {catalog_path}, converting modules: {e}")
+        return build_catalog()
+
+
+catalog = LazyValue(load_catalog)
+
+
+def get_catalog():
+    # Loaded once per process, on first use.
+    return catalog.get()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert products_dictionary and products_info into the catalog file.")
+    parser.add_argument("--path", default=catalog_path)
+    parser.add_argument("--aliases", help="CSV file with alias,name rows")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    converted = build_catalog(args.aliases)
+    convert_time = time.perf_counter() - start
+    converted.save(args.path)
+
+    start = time.perf_counter()
+    loaded = Catalog.load(args.path)
+    load_time = time.perf_counter() - start
+    assert loaded.names == converted.names and loaded.ids == converted.ids
+    assert np.array_equal(loaded.prices, converted.prices) and loaded.aliases == converted.aliases
+
+    print(f"Saved {len(loaded)} products and {len(loaded.aliases)} aliases to {args.path} ({os.path.getsize(args.path)} bytes)")
+    print(f"importing the modules: {convert_time * 1000:.1f} ms, loading the catalog: {load_time * 1000:.1f} ms")
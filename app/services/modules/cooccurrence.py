@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+
+def encode_transactions(df, item_ids=None, min_items=2):
+    """
+    Encode a wide transactions frame (one row per transaction, one product per cell) as a
+    sparse binary transaction-by-item matrix.
+
+    `item_ids` maps known products to their column; products not in it are added in order
+    of first appearance. Transactions with fewer than `min_items` distinct products are
+    dropped since they cannot form pairs. Returns the matrix and the updated mapping.
+    """
+    item_ids = dict(item_ids or {})
+    n_rows, n_cols = df.shape
+    values = df.to_numpy(dtype=object).ravel()
+    present = pd.notna(values)
+    rows = np.repeat(np.arange(n_rows, dtype=np.int64), n_cols)[present]
+    codes, uniques = pd.factorize(values[present])
+    n_uniques = len(uniques)
+    if n_uniques == 0:
+        return sp.csr_matrix((0, len(item_ids)), dtype=np.float64), item_ids
+
+    # One entry per (transaction, product), remembering where it first appeared
+    keys, first_position = np.unique(rows * n_uniques + codes, return_index=True)
+    rows, codes = np.divmod(keys, n_uniques)
+    keep = np.bincount(rows, minlength=n_rows)[rows] >= min_items
+    rows, codes, first_position = rows[keep], codes[keep], first_position[keep]
+
+    # New products get the next columns in order of first appearance
+    not_seen = np.iinfo(np.int64).max
+    item_first_position = np.full(n_uniques, not_seen)
+    np.minimum.at(item_first_position, codes, first_position)
+    columns = np.zeros(n_uniques, dtype=np.int64)
+    for code in np.argsort(item_first_position, kind="stable"):
+        if item_first_position[code] == not_seen:
+            break
+        columns[code] = item_ids.setdefault(uniques[code], len(item_ids))
+
+    transaction_ids, rows = np.unique(rows, return_inverse=True)
+    matrix = sp.csr_matrix(
+        (np.ones(len(rows)), (rows, columns[codes])),
+        shape=(len(transaction_ids), len(item_ids)),
+    )
+    return matrix, item_ids
+
+
+def cooccurrence_counts(transactions, chunk_size=100000):
+    # Item-by-item pair counts as X.T @ X, accumulated over chunks of transactions so memory
+    # stays bounded by the number of distinct pairs, not the number of transactions.
+    n_items = transactions.shape[1]
+    counts = sp.csr_matrix((n_items, n_items), dtype=np.float64)
+    for start in range(0, transactions.shape[0], chunk_size):
+        chunk = transactions[start:start + chunk_size]
+        counts = counts + (chunk.T @ chunk).tocsr()
+    counts.setdiag(0)
+    counts.eliminate_zeros()
+    return counts
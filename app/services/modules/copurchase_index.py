@@ -0,0 +1,202 @@
+import os
+import json
+import logging
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+import scipy.sparse.linalg as spla
+from app.services.modules.blob_storage import blob_cache, read_csv_blob
+from app.services.modules.cooccurrence import encode_transactions, cooccurrence_counts
+from app.services.modules.name_index import NameIndex
+from app.utils.lazy import LazyValue
+from app.utils.files import atomic_write
+
+
+blob_name = "dataConsumoEsp.csv"
+index_path = os.path.join(os.environ.get("COPURCHASE_INDEX_DIR", ".blob_cache"), "copurchase_index.npz")
+
+
+def frame_fingerprint(df):
+    # Cheap content hash of the rows, used to check that old rows were not modified.
+    return int(pd.util.hash_pandas_object(df, index=False).sum())
+
+
+def eigenvector_centrality(matrix, v0=None):
+    # Principal eigenvector of the weighted adjacency matrix, normalized like networkx's
+    # eigenvector_centrality_numpy.
+    n = matrix.shape[0]
+    if n == 0:
+        return np.zeros(0)
+    if n < 3:
+        values, vectors = np.linalg.eigh(matrix.toarray())
+        vector = vectors[:, -1]
+    else:
+        values, vectors = spla.eigsh(matrix, k=1, which="LA", v0=v0)
+        vector = vectors[:, 0]
+    norm = np.linalg.norm(vector)
+    if norm == 0:
+        return np.zeros(n)
+    if vector.sum() < 0:
+        norm = -norm
+    return vector / norm
+
+
+class CopurchaseIndex:
+    """
+    Product co-purchase graph stored as a symmetric sparse matrix.
+
+    Entry (i, j) counts the transactions in which products i and j were bought together.
+    Eigenvector centrality is computed once per update, so a recommendation is a lookup
+    of one matrix row plus a top-N selection.
+    """
+
+    def __init__(self, products=None, matrix=None, centrality=None, transactions_seen=0, fingerprint=0, version=None):
+        self.products = list(products or [])
+        self.product_ids = {product: i for i, product in enumerate(self.products)}
+        self.matrix = matrix if matrix is not None else sp.csr_matrix((0, 0), dtype=np.float64)
+        self.centrality = centrality if centrality is not None else np.zeros(0)
+        self.transactions_seen = transactions_seen
+        self.fingerprint = fingerprint
+        self.version = version
+        self._name_index = None
+
+    def add_transactions(self, df):
+        # Add the pair counts of new transactions and refresh the centrality scores.
+        transactions, self.product_ids = encode_transactions(df, self.product_ids)
+        self.products = sorted(self.product_ids, key=self.product_ids.get)
+        self._name_index = None
+
+        n = len(self.products)
+        matrix = self.matrix
+        if matrix.shape[0] != n:
+            matrix = matrix.tocoo()
+            matrix = sp.coo_matrix((matrix.data, (matrix.row, matrix.col)), shape=(n, n))
+        self.matrix = (matrix + cooccurrence_counts(transactions)).tocsr()
+
+        v0 = None
+        if len(self.centrality) and len(self.centrality) <= n:
+            # Warm start from the previous scores, new products start at a small value
+            v0 = np.full(n, 1e-6)
+            v0[:len(self.centrality)] += np.abs(self.centrality)
+        self.centrality = eigenvector_centrality(self.matrix, v0=v0)
+
+    def copy(self):
+        # Updates replace the arrays instead of modifying them, so sharing them is safe.
+        return CopurchaseIndex(
+            products=self.products,
+            matrix=self.matrix,
+            centrality=self.centrality,
+            transactions_seen=self.transactions_seen,
+            fingerprint=self.fingerprint,
+            version=self.version,
+        )
+
+    @property
+    def name_index(self):
+        if self._name_index is None:
+            self._name_index = NameIndex(self.products)
+        return self._name_index
+
+    def find_product(self, query):
+        return self.name_index.best(query)
+
+    def recommend(self, product, top_n=5):
+        product_id = self.product_ids[product]
+        row = self.matrix.getrow(product_id)
+        neighbors = row.indices
+        if len(neighbors) == 0:
+            return []
+        scores = self.centrality[neighbors]
+        if len(neighbors) > top_n:
+            top = np.argpartition(-scores, top_n)[:top_n]
+        else:
+            top = np.arange(len(neighbors))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(self.products[neighbors[i]], float(scores[i])) for i in top]
+
+    def save(self, path):
+        matrix = self.matrix.tocsr()
+        meta = {"transactions_seen": self.transactions_seen, "fingerprint": self.fingerprint, "version": self.version}
+        with atomic_write(path) as index_file:
+            np.savez(
+                index_file,
+                products=np.array(self.products, dtype=str),
+                data=matrix.data,
+                indices=matrix.indices,
+                indptr=matrix.indptr,
+                shape=np.array(matrix.shape),
+                centrality=self.centrality,
+                meta=np.array(json.dumps(meta)),
+            )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as stored:
+            meta = json.loads(str(stored["meta"]))
+            matrix = sp.csr_matrix(
+                (stored["data"], stored["indices"], stored["indptr"]),
+                shape=tuple(stored["shape"]),
+            )
+            return cls(
+                products=stored["products"].tolist(),
+                matrix=matrix,
+                centrality=stored["centrality"],
+                transactions_seen=meta["transactions_seen"],
+                fingerprint=meta["fingerprint"],
+                version=meta["version"],
+            )
+
+
+copurchase = LazyValue()
+
+
+def update_index(index, version):
+    # Bring the index up to date with the current transactions blob. New rows appended at the
+    # end are added incrementally; any other change triggers a full rebuild. The published index
+    # is never modified: the update is built on a copy that the caller swaps in.
+    transactions = read_csv_blob(blob_name)
+    if transactions is None:
+        return index
+
+    seen = index.transactions_seen if index is not None else 0
+    if index is not None and 0 < seen <= len(transactions) and frame_fingerprint(transactions.iloc[:seen]) == index.fingerprint:
+        index = index.copy()
+        new_rows = transactions.iloc[seen:]
+        logging.info(f"Adding {len(new_rows)} new transactions to the co-purchase index.")
+    else:
+        index = CopurchaseIndex()
+        new_rows = transactions
+        logging.info(f"Building the co-purchase index from {len(new_rows)} transactions.")
+
+    index.add_transactions(new_rows)
+    index.transactions_seen = len(transactions)
+    index.fingerprint = frame_fingerprint(transactions)
+    index.version = version
+    index.save(index_path)
+    return index
+
+
+def load_or_update_index(index, version):
+    # Index from disk on a cold start, then brought up to date with the transactions blob.
+    if index is None and os.path.exists(index_path):
+        try:
+            index = CopurchaseIndex.load(index_path)
+        except Exception as e:
+            logging.error(f"Could not load co-purchase index: {e}")
+    if index is None or index.version != version:
+        index = update_index(index, version)
+    return index
+
+
+def get_copurchase_index():
+    # Index for the current version of the transactions blob, or None if it cannot be loaded.
+    try:
+        version = blob_cache.get_version(blob_name)
+    except Exception as e:
+        logging.error(f"Failed to load {blob_name} from Azure Blob Storage: {e}")
+        return copurchase.value
+
+    return copurchase.get(
+        is_current=lambda index: index.version == version,
+        build=lambda index: load_or_update_index(index, version),
+    )
@@ -1,40 +1,13 @@
 import pandas as pd
-import os
-from dotenv import find_dotenv, load_dotenv
 from openpyxl.styles import Font, Alignment, Border, Side, PatternFill
-from azure.storage.blob import BlobServiceClient
+from app.services.modules.blob_storage import read_excel_blob, upload_file_to_blob
 
 
-load_dotenv(find_dotenv())
-SAS_TOKEN = os.environ["SAS_TOKEN"]
-
-account_name = "pythonwhatsappbotstorage"
-container_name = "data"
 blob_name_load = "df_sales.xlsx"
-sas_token = SAS_TOKEN
 file_path_upload = "income_statement_visual.xlsx"
 blob_name_upload = "income_statement_visual.xlsx"
 
 
-def load_data_from_azure(account_name, container_name, blob_name, sas_token):
-    try:
-        # Create a BlobServiceClient using the SAS Token and get a client to interact with the specified blob
-        blob_service_client = BlobServiceClient(account_url=f"https://{account_name}.blob.core.windows.net", credential=sas_token)
-        blob_client = blob_service_client.get_blob_client(container=container_name, blob=blob_name)
-        
-        # Download the blob to a local memory stream
-        with open(blob_name_load, "wb") as download_file:
-            download_file.write(blob_client.download_blob().readall())
-        df = pd.read_excel(blob_name_load)
-
-        return df
-
-    except Exception as e:
-        # Handle generic exceptions which could be related to Azure access issues, network problems, etc.
-        print(f"Failed to load data from Azure Blob Storage: {e}")
-        return None
-
-
 def create_income_statement(df):
     try:
         def load_and_process_data(df):
@@ -358,27 +331,7 @@ def create_income_statement(df):
         return f"An unexpected error occurred: {e}"
     
 
-def upload_to_azure_with_sas(file_path, account_name, container_name, blob_name, sas_token):
-    try:
-        # Create the BlobServiceClient object using the SAS token and the account URL
-        account_url = f"https://{account_name}.blob.core.windows.net"
-        blob_service_client = BlobServiceClient(account_url=account_url, credential=sas_token)
-
-        # Create a blob client using the local file name as the name for the blob
-        blob_client = blob_service_client.get_blob_client(container=container_name, blob=blob_name)
-
-        print(f"Uploading to Azure Storage as blob:\n\t{blob_name}")
-
-        # Upload the created file
-        with open(file_path, "rb") as data:
-            blob_client.upload_blob(data, overwrite=True)
-
-        return f"File {file_path} uploaded to Azure Blob Storage successfully as {blob_name}."
-    except Exception as ex:
-        return f"An error occurred: {ex}"
-
-
-df_sales = load_data_from_azure(account_name, container_name, blob_name_load, sas_token)
+df_sales = read_excel_blob(blob_name_load)
 create_income_statement(df_sales)
-message = upload_to_azure_with_sas(file_path_upload, account_name, container_name, blob_name_upload, sas_token)
+message = upload_file_to_blob(file_path_upload, blob_name_upload)
 print(message)
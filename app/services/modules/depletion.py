@@ -0,0 +1,39 @@
+import numpy as np
+
+
+def depletion_days(inventory, forecasts, thresholds):
+    """
+    Days until each product's inventory falls to each threshold, for many products at once.
+
+    `inventory` has one value per product, `forecasts` one row of daily sales per product
+    and `thresholds` either one value per product or a (products, thresholds) matrix.
+    Returns an int array shaped like the thresholds: 0 when the inventory is already at
+    or below the threshold, the day number (1-based) when it is reached within the
+    forecast, and -1 when it is not reached.
+    """
+    inventory = np.asarray(inventory, dtype=np.float64)
+    forecasts = np.asarray(forecasts, dtype=np.float64)
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    single = thresholds.ndim == 1
+    if single:
+        thresholds = thresholds[:, None]
+    n_products, horizon = forecasts.shape
+    if n_products == 0 or horizon == 0:
+        days = np.where(inventory[:, None] <= thresholds, 0, -1)
+        return days[:, 0] if single else days
+
+    # The inventory first reaches a threshold where cumulative sales first reach the amount needed,
+    # which is also where their running maximum does; that maximum never decreases, even with
+    # negative forecasts, so every row is sorted. Clamping at 0 keeps it that way for positive targets.
+    cumulative = np.maximum(np.maximum.accumulate(np.cumsum(np.nan_to_num(forecasts), axis=1), axis=1), 0)
+    needed = inventory[:, None] - thresholds
+
+    # Shift each row into its own value range so one searchsorted covers every product
+    span = max(cumulative[:, -1].max(), needed.max(), 0) + 1
+    offsets = np.arange(n_products)[:, None] * span
+    positions = np.searchsorted((cumulative + offsets).ravel(), (np.maximum(needed, 0) + offsets).ravel())
+    positions = positions.reshape(needed.shape) - np.arange(n_products)[:, None] * horizon
+
+    days = np.where(positions < horizon, positions + 1, -1)
+    days[needed <= 0] = 0
+    return days[:, 0] if single else days
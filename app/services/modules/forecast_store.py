@@ -0,0 +1,401 @@
+import os
+import json
+import time
+import fcntl
+import signal
+import logging
+import argparse
+import warnings
+import threading
+import multiprocessing
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+from statsmodels.tsa.stattools import adfuller
+from statsmodels.tsa.arima.model import ARIMA
+from app.services.modules.sales_data import load_sales_data, get_sales_data_version
+from app.utils.lazy import LazyValue
+from app.utils.files import atomic_write
+
+
+forecast_order = (3, 1, 3)
+forecast_horizon = int(os.environ.get("FORECAST_HORIZON", 30))
+forecast_max_age = float(os.environ.get("FORECAST_MAX_AGE_HOURS", 24)) * 3600
+forecast_workers = int(os.environ.get("FORECAST_WORKERS", os.cpu_count() or 1))
+forecast_timeout = float(os.environ.get("FORECAST_TIMEOUT_SECONDS", 60))
+store_path = os.path.join(os.environ.get("FORECAST_STORE_DIR", ".blob_cache"), "forecasts.npz")
+
+# Fitted statsmodels results for on-demand forecasts, keyed by (product, data version, order)
+model_cache = OrderedDict()
+model_cache_size = int(os.environ.get("FORECAST_MODEL_CACHE_SIZE", 64))
+model_cache_lock = threading.Lock()
+model_counters = {"hits": 0, "warm_starts": 0, "fits": 0}
+
+
+class InsufficientDataError(ValueError):
+    pass
+
+
+def product_sales(df, product):
+    # Daily sales series of one product, indexed by date.
+    return df[df['product'] == product].set_index('date')['sales']
+
+
+def fit_model(sales, order=forecast_order):
+    """
+    Fit the sales model for one product.
+
+    Same model the tools always used: an ADF test, differencing when the series is not
+    stationary, then ARIMA(3, 1, 3). Returns the fitted results and whether the series
+    was differenced.
+    """
+    # Make the series stationary if needed
+    differenced = adfuller(sales)[1] > 0.05
+    if differenced:
+        if sales.diff().dropna().empty:
+            raise InsufficientDataError("No hay suficientes datos para realizar un pronóstico.")
+        sales = sales.diff()
+
+    return ARIMA(sales, order=order).fit(), differenced
+
+
+def fit_forecast(sales, horizon, order=forecast_order):
+    # Forecast of `horizon` days and the fitted parameters.
+    fitted_model, _ = fit_model(sales, order)
+    return np.asarray(fitted_model.forecast(steps=horizon), dtype=np.float64), np.asarray(fitted_model.params, dtype=np.float64)
+
+
+def warm_start(entry, sales):
+    # Extend a cached fit with the days appended since, keeping its parameters; None if not possible.
+    previous = entry["sales"]
+    n = len(previous)
+    if len(sales) <= n or not sales.index[:n].equals(previous.index) or not np.array_equal(sales.values[:n], previous.values):
+        return None
+    new_observations = sales.diff().iloc[n:] if entry["differenced"] else sales.iloc[n:]
+    try:
+        return entry["results"].append(new_observations, refit=False)
+    except Exception as e:
+        logging.info(f"Could not extend the cached forecast model, refitting: {e}")
+        return None
+
+
+def get_fitted_model(product, version, sales, order=forecast_order):
+    """
+    Fitted results for a product's sales at a data version, memoized in an LRU.
+
+    When an older fit of the same product covers a prefix of `sales` (only new days were
+    added), the new observations are appended to it with the already estimated parameters
+    instead of re-estimating. The background refresh re-estimates every product anyway.
+    """
+    key = (product, version, order)
+    with model_cache_lock:
+        entry = model_cache.get(key)
+        if entry is not None:
+            model_cache.move_to_end(key)
+            model_counters["hits"] += 1
+            return entry["results"]
+        previous = next((model_cache[cached] for cached in reversed(model_cache) if cached[0] == product and cached[2] == order), None)
+
+    results = warm_start(previous, sales) if previous is not None else None
+    if results is not None:
+        differenced = previous["differenced"]
+        counter = "warm_starts"
+    else:
+        results, differenced = fit_model(sales, order)
+        counter = "fits"
+
+    with model_cache_lock:
+        model_counters[counter] += 1
+        model_cache[key] = {"results": results, "sales": sales, "differenced": differenced}
+        model_cache.move_to_end(key)
+        while len(model_cache) > model_cache_size:
+            model_cache.popitem(last=False)
+    return results
+
+
+def raise_timeout(signum, frame):
+    raise TimeoutError("forecast took too long")
+
+
+def fit_product(product, sales, horizon, timeout):
+    # Runs in a worker process. Errors are returned, not raised, so one product cannot fail the batch.
+    if timeout:
+        signal.signal(signal.SIGALRM, raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        # Convergence and frequency warnings would otherwise be printed once per product
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            forecast, params = fit_forecast(sales, horizon)
+        return product, forecast, params, None
+    except Exception as e:
+        return product, None, None, f"{type(e).__name__}: {e}"
+    finally:
+        if timeout:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+def log_progress(done, total):
+    if done == total or done % max(1, total // 10) == 0:
+        logging.info(f"Forecasts: {done}/{total} products fitted.")
+
+
+def forecast_all(df, horizon=forecast_horizon, workers=None, timeout=forecast_timeout, progress=log_progress):
+    """
+    Fit the forecast of every product in the sales frame across a process pool.
+
+    The frame is grouped by product once and each series is fitted in a worker process,
+    with a per-product timeout. Returns a dict of product -> (forecast, params, last date)
+    in the frame's product order, and a dict of product -> error for the ones that failed.
+    """
+    series = [(product, product_df.set_index('date')['sales']) for product, product_df in df.groupby('product', sort=False)]
+    fitted = {}
+    failures = {}
+    # Forking a web worker that already runs queue, timer and client threads can deadlock the
+    # children, so workers come from a forkserver started without them
+    mp_context = multiprocessing.get_context("forkserver")
+    with ProcessPoolExecutor(max_workers=workers or forecast_workers, mp_context=mp_context) as executor:
+        futures = {executor.submit(fit_product, product, sales, horizon, timeout): product for product, sales in series}
+        for done, future in enumerate(as_completed(futures), 1):
+            product = futures[future]
+            try:
+                _, forecast, params, error = future.result()
+            except Exception as e:
+                # The worker process itself died
+                forecast, params, error = None, None, f"{type(e).__name__}: {e}"
+            if error is None:
+                fitted[product] = (forecast, params)
+            else:
+                failures[product] = error
+            if progress:
+                progress(done, len(futures))
+
+    results = {product: (*fitted[product], sales.index[-1]) for product, sales in series if product in fitted}
+    return results, failures
+
+
+class ForecastStore:
+    """
+    Precomputed forecasts for every product, tagged with the sales data version they were fitted on.
+
+    Each entry holds the forecast for the next `horizon` days, the fitted ARIMA
+    parameters and the last date of the series. Saved as one .npz of fixed-width arrays.
+    """
+
+    def __init__(self, version=None, horizon=forecast_horizon, created_at=0.0):
+        self.version = version
+        self.horizon = horizon
+        self.created_at = created_at
+        self.entries = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def put(self, product, version, forecast, params, last_date):
+        self.entries[product] = {
+            "version": version,
+            "forecast": forecast,
+            "params": params,
+            "last_date": pd.Timestamp(last_date),
+        }
+
+    def get(self, product, n_days, version):
+        # Forecast as a date-indexed Series, or None when missing, stale or too short.
+        entry = self.entries.get(product)
+        if entry is None or entry["version"] != version or n_days > len(entry["forecast"]):
+            return None
+        dates = pd.date_range(entry["last_date"] + pd.Timedelta(days=1), periods=n_days, freq="D")
+        return pd.Series(entry["forecast"][:n_days], index=dates, name="predicted_mean")
+
+    def values_from(self, start, product, n_days):
+        # Forecast values for `n_days` starting at `start`, from whichever fit is stored for the
+        # product, even one of an older data version; None when the stored dates do not cover them.
+        entry = self.entries.get(product)
+        if entry is None:
+            return None
+        offset = (pd.Timestamp(start) - entry["last_date"]).days - 1
+        if offset < 0 or offset + n_days > len(entry["forecast"]):
+            return None
+        return entry["forecast"][offset:offset + n_days]
+
+    def is_fresh(self, version):
+        return self.version == version and time.time() - self.created_at < forecast_max_age
+
+    def save(self, path):
+        products = list(self.entries)
+        n_params = max((len(entry["params"]) for entry in self.entries.values()), default=0)
+        forecasts = np.full((len(products), self.horizon), np.nan)
+        params = np.full((len(products), n_params), np.nan)
+        for i, product in enumerate(products):
+            entry = self.entries[product]
+            forecasts[i, :len(entry["forecast"][:self.horizon])] = entry["forecast"][:self.horizon]
+            params[i, :len(entry["params"])] = entry["params"]
+        meta = {"version": self.version, "horizon": self.horizon, "created_at": self.created_at}
+        with atomic_write(path) as store_file:
+            np.savez(
+                store_file,
+                products=np.array(products, dtype=str),
+                versions=np.array([self.entries[product]["version"] or "" for product in products], dtype=str),
+                last_dates=np.array([self.entries[product]["last_date"].value for product in products], dtype=np.int64),
+                forecasts=forecasts,
+                params=params,
+                meta=np.array(json.dumps(meta)),
+            )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as stored:
+            meta = json.loads(str(stored["meta"]))
+            store = cls(meta["version"], meta["horizon"], meta["created_at"])
+            for product, version, last_date, forecast, params in zip(
+                stored["products"].tolist(),
+                stored["versions"].tolist(),
+                stored["last_dates"].tolist(),
+                stored["forecasts"],
+                stored["params"],
+            ):
+                store.put(product, version, forecast, params[~np.isnan(params)], pd.Timestamp(last_date))
+            return store
+
+
+# In-memory store and the mtime of the file it was loaded from
+forecasts = LazyValue()
+
+
+def load_store(loaded, mtime):
+    if mtime is not None:
+        try:
+            return {"store": ForecastStore.load(store_path), "mtime": mtime}
+        except Exception as e:
+            logging.error(f"Could not load the forecast store: {e}")
+    # Keep what is loaded; a failed load is retried on the next call
+    return loaded or {"store": ForecastStore(), "mtime": None}
+
+
+def current_store():
+    # In-memory store, reloaded when another process wrote a newer file.
+    try:
+        mtime = os.path.getmtime(store_path)
+    except OSError:
+        mtime = None
+    loaded = forecasts.get(
+        is_current=lambda loaded: mtime is None or loaded["mtime"] == mtime,
+        build=lambda loaded: load_store(loaded, mtime),
+    )
+    return loaded["store"]
+
+
+def refresh_forecasts(df=None, version=None):
+    # Fit every product in the sales data and replace the stored forecasts.
+    if version is None:
+        version = get_sales_data_version()
+    if df is None:
+        df = load_sales_data()
+    if df is None:
+        return None
+
+    start = time.perf_counter()
+    store = ForecastStore(version, forecast_horizon, time.time())
+    results, failures = forecast_all(df, forecast_horizon)
+    for product, (forecast, params, last_date) in results.items():
+        store.put(product, version, forecast, params, last_date)
+    for product, error in failures.items():
+        logging.warning(f"Could not fit a forecast for {product}: {error}")
+
+    store.save(store_path)
+    forecasts.set({"store": store, "mtime": os.path.getmtime(store_path)})
+    logging.info(f"Refreshed {len(store)} forecasts ({len(failures)} failed) in {time.perf_counter() - start:.1f}s.")
+    return store
+
+
+def get_forecast(product, n_days, df):
+    """
+    Forecast of `n_days` for a product, from the store when it is current for this data version.
+
+    Stale or missing products are fitted on demand, and the result is kept in memory
+    until the next refresh.
+    """
+    version = get_sales_data_version()
+    store = current_store()
+    forecast = store.get(product, n_days, version)
+    if forecast is not None:
+        return forecast
+
+    sales = product_sales(df, product)
+    fitted_model = get_fitted_model(product, version, sales)
+    values = np.asarray(fitted_model.forecast(steps=max(n_days, forecast_horizon)), dtype=np.float64)
+    store.put(product, version, values, np.asarray(fitted_model.params, dtype=np.float64), sales.index[-1])
+    return store.get(product, n_days, version)
+
+
+def stored_forecasts(products, start_dates, n_days):
+    """
+    Stored forecasts of `n_days` for many products, without fitting any model.
+
+    Meant for questions about the whole catalog, which cannot afford one ARIMA fit per
+    product. Returns one array per product, or None where the store has nothing that
+    covers the dates; those products are filled in by the next refresh.
+    """
+    store = current_store()
+    return [store.values_from(start, product, n_days) for product, start in zip(products, start_dates)]
+
+
+@contextmanager
+def refresh_file_lock():
+    # Only one process refreshes at a time; the others skip and reload the file later.
+    os.makedirs(os.path.dirname(store_path) or ".", exist_ok=True)
+    with open(f"{store_path}.lock", "w") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def refresh_if_stale():
+    version = get_sales_data_version()
+    if current_store().is_fresh(version):
+        return False
+    with refresh_file_lock() as acquired:
+        if not acquired or current_store().is_fresh(version):
+            return False
+        refresh_forecasts(version=version)
+        return True
+
+
+def forecast_refresh_loop(interval):
+    while True:
+        try:
+            refresh_if_stale()
+        except Exception as e:
+            logging.error(f"Forecast refresh failed: {e}")
+        time.sleep(interval)
+
+
+def init_forecast_refresher(app):
+    # Background thread that refits the forecasts when the sales data changes, or once they are a day
+    # old. Every web worker starts one; refresh_file_lock lets only one of them refit at a time.
+    interval = app.config["FORECAST_REFRESH_INTERVAL"]
+    if interval <= 0:
+        return None
+    thread = threading.Thread(target=forecast_refresh_loop, args=(interval,), name="forecast-refresher", daemon=True)
+    thread.start()
+    app.extensions["forecast_refresher"] = thread
+    return thread
+
+
+if __name__ == "__main__":
+    # Refit now, e.g. at deploy time or from cron with FORECAST_REFRESH_INTERVAL=0:
+    # python -m app.services.modules.forecast_store
+    parser = argparse.ArgumentParser(description="Refit the stored forecasts for every product.")
+    parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    store = refresh_forecasts()
+    print(f"Stored forecasts for {len(store) if store else 0} products in {store_path}")
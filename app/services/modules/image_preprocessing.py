@@ -0,0 +1,109 @@
+import io
+import os
+import time
+import logging
+
+try:
+    from PIL import Image, ImageFilter, ImageOps
+except ImportError:  # Pillow is optional, images are then sent as downloaded
+    Image = None
+
+
+# IMAGE_PREPROCESSING=false sends photos untouched, to compare latency and token usage
+enabled = os.environ.get("IMAGE_PREPROCESSING", "true").lower() == "true"
+max_dimension = int(os.environ.get("IMAGE_MAX_DIMENSION", 1600))
+grayscale = os.environ.get("IMAGE_GRAYSCALE", "true").lower() == "true"
+crop_to_receipt = os.environ.get("IMAGE_CROP", "true").lower() == "true"
+jpeg_quality = int(os.environ.get("IMAGE_JPEG_QUALITY", 80))
+
+
+def otsu_threshold(histogram):
+    # Gray level that best separates the bright receipt from the background.
+    total = sum(histogram)
+    weighted_sum = sum(level * count for level, count in enumerate(histogram))
+    background_count = 0
+    background_sum = 0
+    best_level, best_variance = 127, 0
+    for level, count in enumerate(histogram):
+        background_count += count
+        if background_count == 0:
+            continue
+        foreground_count = total - background_count
+        if foreground_count == 0:
+            break
+        background_sum += level * count
+        background_mean = background_sum / background_count
+        foreground_mean = (weighted_sum - background_sum) / foreground_count
+        variance = background_count * foreground_count * (background_mean - foreground_mean) ** 2
+        if variance > best_variance:
+            best_level, best_variance = level, variance
+    return best_level
+
+
+def receipt_box(gray, margin=0.02, min_area=0.2):
+    # Bounding box of the bright region, or None when it does not look like a receipt.
+    small = gray.copy()
+    small.thumbnail((256, 256))
+    threshold = otsu_threshold(small.histogram())
+    mask = small.point(lambda level: 255 if level > threshold else 0).filter(ImageFilter.MedianFilter(5))
+    box = mask.getbbox()
+    if box is None:
+        return None
+
+    scale_x = gray.width / small.width
+    scale_y = gray.height / small.height
+    left, top, right, bottom = box
+    if (right - left) * (bottom - top) < min_area * small.width * small.height:
+        return None
+    pad_x = margin * gray.width
+    pad_y = margin * gray.height
+    return (
+        max(0, int(left * scale_x - pad_x)),
+        max(0, int(top * scale_y - pad_y)),
+        min(gray.width, int(right * scale_x + pad_x)),
+        min(gray.height, int(bottom * scale_y + pad_y)),
+    )
+
+
+def preprocess_image(image_file):
+    """
+    Shrink a ticket photo before it is sent to the vision model.
+
+    Applies the EXIF rotation, converts to grayscale, crops to the receipt, downscales the
+    longest side to IMAGE_MAX_DIMENSION and recompresses as JPEG. Returns a new BytesIO,
+    or the original file when Pillow is missing or the image cannot be processed.
+    """
+    if not enabled or Image is None:
+        return image_file
+
+    start = time.perf_counter()
+    try:
+        image_file.seek(0, io.SEEK_END)
+        original_bytes = image_file.tell()
+        image_file.seek(0)
+        with Image.open(image_file) as image:
+            image = ImageOps.exif_transpose(image)
+            image = image.convert("L") if grayscale else image.convert("RGB")
+            if crop_to_receipt:
+                box = receipt_box(image if grayscale else image.convert("L"))
+                if box is not None:
+                    image = image.crop(box)
+            image.thumbnail((max_dimension, max_dimension))
+
+            processed = io.BytesIO()
+            image.save(processed, format="JPEG", quality=jpeg_quality, optimize=True)
+    except Exception as e:
+        logging.error(f"Could not preprocess image, sending the original: {e}")
+        image_file.seek(0)
+        return image_file
+
+    processed_bytes = processed.tell()
+    if processed_bytes >= original_bytes:
+        image_file.seek(0)
+        return image_file
+    processed.seek(0)
+    logging.info(
+        f"Preprocessed image {original_bytes} -> {processed_bytes} bytes "
+        f"({1 - processed_bytes / original_bytes:.0%} saved) in {(time.perf_counter() - start) * 1000:.0f} ms."
+    )
+    return processed
@@ -1,41 +1,11 @@
-import pandas as pd
 import numpy as np
-import os
 import shelve
 import logging
-from azure.storage.blob import BlobServiceClient
-from dotenv import find_dotenv, load_dotenv
+from app.services.modules.sales_data import load_sales_data, find_sales_product
 
 
-load_dotenv(find_dotenv())
-SAS_TOKEN = os.environ["SAS_TOKEN"]
-
-account_name = "pythonwhatsappbotstorage"
-container_name = "data"
-blob_name_load = "Abarrotes Cruz.xlsx"
-sas_token = SAS_TOKEN
-
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def load_data_from_azure(account_name, container_name, blob_name, sas_token):
-    try:
-        # Create a BlobServiceClient using the SAS Token and get a client to interact with the specified blob
-        blob_service_client = BlobServiceClient(account_url=f"https://{account_name}.blob.core.windows.net", credential=sas_token)
-        blob_client = blob_service_client.get_blob_client(container=container_name, blob=blob_name)
-        
-        # Download the blob to a local memory stream
-        with open(blob_name_load, "wb") as download_file:
-            download_file.write(blob_client.download_blob().readall())
-        df = pd.read_excel(blob_name_load)
-
-        return df
-
-    except Exception as e:
-        # Handle generic exceptions which could be related to Azure access issues, network problems, etc.
-        print(f"Failed to load data from Azure Blob Storage: {e}")
-        return None
-
-
 def get_lead_time(product_name):
     with shelve.open('lead_time_shelf') as db:
         if product_name in db:
@@ -47,11 +17,10 @@ def get_lead_time(product_name):
 def calculate_inventory_metrics(product_name):
     try:
         # Load the data frame from Excel
-        df = load_data_from_azure(account_name, container_name, blob_name_load, sas_token)
+        df = load_sales_data()
         
-        # Filter the DataFrame for a specific product using regex for flexible matching
-        pattern = f".*{product_name}.*"  # Create a regex pattern that matches any part of the product name
-        df = df[df['product'].str.contains(pattern, case=False, na=False)]
+        # Filter the DataFrame for the product whose name best matches the query
+        df = df[df['product'] == find_sales_product(product_name)]
 
         # Check if there are any data entries for the product
         if df.empty:
@@ -0,0 +1,54 @@
+import shelve
+import numpy as np
+import pandas as pd
+
+
+lead_time_path = 'lead_time_shelf'
+
+
+def load_lead_times(path=lead_time_path):
+    # Every saved lead time in one read of the shelf, as a Series indexed by product.
+    try:
+        with shelve.open(path, flag='r') as db:
+            return pd.Series(dict(db), dtype=np.float64)
+    except Exception:
+        # The shelf does not exist until the first lead time is saved
+        return pd.Series(dtype=np.float64)
+
+
+def compute_inventory_metrics(df, lead_times, interest_rate=0.115, ordering_cost_factor=0.48, service_level=1.65):
+    """
+    EOQ and ROP inputs and results for every product of the sales frame in one groupby.
+
+    Mean cost and mean purchases only count non-zero days. Returns a frame indexed by
+    product with cost_per_unit, purchase_quantity, sales_average, std_dev_demand,
+    lead_time, safety_stock, eoq, rop and current_inventory. Products without a
+    lead time get a NaN rop.
+    """
+    grouped = pd.DataFrame({
+        'product': df['product'],
+        'cost': df['cost'].where(df['cost'] > 0),
+        'purchases': df['purchases'].where(df['purchases'] > 0),
+        'sales': df['sales'],
+    }).groupby('product', sort=False)
+
+    metrics = grouped.agg(
+        cost_per_unit=('cost', 'mean'),
+        purchase_quantity=('purchases', 'mean'),
+        sales_average=('sales', 'mean'),
+        std_dev_demand=('sales', 'std'),
+    )
+    metrics[['cost_per_unit', 'purchase_quantity']] = metrics[['cost_per_unit', 'purchase_quantity']].fillna(0)
+    metrics['lead_time'] = lead_times.reindex(metrics.index)
+
+    ordering_cost = metrics['cost_per_unit'] * metrics['purchase_quantity'] * ordering_cost_factor
+    holding_cost_per_unit = metrics['cost_per_unit'] * interest_rate
+    with np.errstate(divide='ignore', invalid='ignore'):
+        eoq = np.sqrt((2 * metrics['sales_average'] * ordering_cost) / holding_cost_per_unit)
+    metrics['safety_stock'] = service_level * metrics['std_dev_demand']
+    metrics['eoq'] = eoq.where(holding_cost_per_unit > 0, 15).round(0)
+    metrics['rop'] = (metrics['sales_average'] * metrics['lead_time'] + metrics['safety_stock']).round(0)
+
+    # Inventory on the last row of each product
+    metrics['current_inventory'] = df.drop_duplicates('product', keep='last').set_index('product')['inventory']
+    return metrics
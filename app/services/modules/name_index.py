@@ -0,0 +1,89 @@
+import re
+import unicodedata
+import numpy as np
+
+
+def normalize_name(text):
+    # Lowercase, strip accents and punctuation, collapse whitespace: "Café  Soluble" -> "cafe soluble"
+    text = unicodedata.normalize("NFKD", str(text))
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return " ".join(re.sub(r"[^0-9a-z]+", " ", text.lower()).split())
+
+
+def trigrams(normalized):
+    padded = f" {normalized} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class NameIndex:
+    """
+    Trigram index over a fixed list of product names.
+
+    Names are accent-folded and lowercased once when the index is built. A query only
+    touches the posting lists of its own trigrams, and candidates are ranked by trigram
+    similarity plus how many query words start a word of the name. Ties are broken by
+    the shorter name and then alphabetically, so the same query always gives the same
+    product.
+    """
+
+    def __init__(self, names):
+        self.names = list(dict.fromkeys(names))
+        self.normalized = [normalize_name(name) for name in self.names]
+        self.tokens = [normalized.split() for normalized in self.normalized]
+        self.exact = {}
+        for i, normalized in enumerate(self.normalized):
+            self.exact.setdefault(normalized, i)
+
+        postings = {}
+        sizes = np.zeros(len(self.names), dtype=np.float64)
+        for i, normalized in enumerate(self.normalized):
+            grams = trigrams(normalized)
+            sizes[i] = len(grams)
+            for gram in grams:
+                postings.setdefault(gram, []).append(i)
+        self.postings = {gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()}
+        self.sizes = sizes
+        self.name_lengths = np.array([len(normalized) for normalized in self.normalized])
+        # Position of each name in alphabetical order, used as the final tie-breaker
+        self.alphabetical = np.argsort(np.argsort(np.array(self.normalized, dtype=object), kind="stable"))
+
+    def __len__(self):
+        return len(self.names)
+
+    def _token_coverage(self, query_tokens, i):
+        name_tokens = self.tokens[i]
+        matched = sum(1 for token in query_tokens if any(name_token.startswith(token) for name_token in name_tokens))
+        return matched / len(query_tokens)
+
+    def search(self, query, limit=5, min_score=0.3):
+        # Ranked (name, score) candidates for a free-text query, best first.
+        normalized = normalize_name(query)
+        if not normalized or not self.names:
+            return []
+
+        exact = self.exact.get(normalized)
+        query_grams = trigrams(normalized)
+        lists = [self.postings[gram] for gram in query_grams if gram in self.postings]
+        if not lists:
+            return [(self.names[exact], 1.0)] if exact is not None else []
+
+        shared = np.bincount(np.concatenate(lists), minlength=len(self.names))
+        similarity = 2 * shared / (len(query_grams) + self.sizes)
+        # Only re-rank a short list of the most similar names
+        shortlist_size = min(len(self.names), max(limit * 8, 40))
+        shortlist = np.argpartition(-similarity, shortlist_size - 1)[:shortlist_size]
+        shortlist = shortlist[shared[shortlist] > 0]
+
+        query_tokens = normalized.split()
+        scored = []
+        for i in shortlist.tolist():
+            score = 1.0 if i == exact else 0.6 * similarity[i] + 0.4 * self._token_coverage(query_tokens, i)
+            if score >= min_score:
+                scored.append((-score, self.name_lengths[i], self.alphabetical[i], i))
+        scored.sort()
+        return [(self.names[i], round(float(-score), 4)) for score, _, _, i in scored[:limit]]
+
+    def best(self, query, min_score=0.3):
+        # Single best matching name, or None when nothing is similar enough.
+        results = self.search(query, limit=1, min_score=min_score)
+        return results[0][0] if results else None
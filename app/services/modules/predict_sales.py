@@ -1,77 +1,30 @@
+import logging
+import numpy as np
 import pandas as pd
-from statsmodels.tsa.stattools import adfuller
-from statsmodels.tsa.arima.model import ARIMA
 from datetime import timedelta
-import os
-from azure.storage.blob import BlobServiceClient
-from dotenv import find_dotenv, load_dotenv
-
-
-load_dotenv(find_dotenv())
-SAS_TOKEN = os.environ["SAS_TOKEN"]
-
-account_name = "pythonwhatsappbotstorage"
-container_name = "data"
-blob_name_load = "Abarrotes Cruz.xlsx"
-sas_token = SAS_TOKEN
-
-
-def load_data_from_azure(account_name, container_name, blob_name, sas_token):
-    try:
-        # Create a BlobServiceClient using the SAS Token and get a client to interact with the specified blob
-        blob_service_client = BlobServiceClient(account_url=f"https://{account_name}.blob.core.windows.net", credential=sas_token)
-        blob_client = blob_service_client.get_blob_client(container=container_name, blob=blob_name)
-        
-        # Download the blob to a local memory stream
-        with open(blob_name_load, "wb") as download_file:
-            download_file.write(blob_client.download_blob().readall())
-        df = pd.read_excel(blob_name_load)
-
-        return df
-
-    except Exception as e:
-        # Handle generic exceptions which could be related to Azure access issues, network problems, etc.
-        print(f"Failed to load data from Azure Blob Storage: {e}")
-        return None
+from app.services.modules.sales_data import load_sales_data, find_sales_product
+from app.services.modules.forecast_store import get_forecast, stored_forecasts, forecast_horizon, InsufficientDataError
+from app.services.modules.depletion import depletion_days
 
 
 def forecast_sales(product, n_days):
     try:
         # Load data
-        df = load_data_from_azure(account_name, container_name, blob_name_load, sas_token)
-        df.set_index('date', inplace=True)
+        df = load_sales_data()
 
-        # Filter data by product using a case-insensitive regex match
-        pattern = f".*{product}.*"  # Create a regex pattern that matches any part of the product name
-        df = df[df['product'].str.contains(pattern, case=False, na=False)]
+        # Filter data by the product whose name best matches the query
+        actual_product_name = find_sales_product(product)
 
         # Check if data is available for the product
-        if df.empty:
+        if actual_product_name is None:
             return "No se encontró información acerca de ese producto."
 
-        # Extract the actual product name from the first matched entry
-        actual_product_name = df.iloc[0]['product']
-
-        # Check for stationarity
-        result = adfuller(df['sales'])
-
-        # Make the series stationary if needed
-        if result[1] > 0.05:
-            df['sales_diff'] = df['sales'].diff().dropna()
-            if df['sales_diff'].empty:
-                return "No hay suficientes datos para realizar un pronóstico."
-            data_for_model = df['sales_diff']
-        else:
-            data_for_model = df['sales']
-
-        # Fit the ARIMA model
-        model = ARIMA(data_for_model, order=(3, 1, 3))  # Modify the order based on your data analysis
-        fitted_model = model.fit()
-
-        # Forecast future sales
-        forecast = round(fitted_model.forecast(steps=n_days), 0)
+        # Forecast future sales, precomputed unless the product is missing or stale
+        forecast = round(get_forecast(actual_product_name, n_days, df), 0)
         return f"Las ventas pronosticadas para los siguientes {n_days} días de {actual_product_name} son: {forecast}"
     
+    except InsufficientDataError as e:
+        return str(e)
     except FileNotFoundError:
         return "El archivo de datos no se encontró."
     except KeyError as e:
@@ -85,38 +38,22 @@ def forecast_sales(product, n_days):
 def forecast_sales2(product, n_days):
     try:
         # Load data
-        df = pd.read_excel("Abarrotes Cruz.xlsx")
-        df.set_index('date', inplace=True)
+        df = load_sales_data()
 
-        # Filter data by product using a case-insensitive regex match
-        pattern = f".*{product}.*"  # Create a regex pattern that matches any part of the product name
-        df = df[df['product'].str.contains(pattern, case=False, na=False)]
+        # Filter data by the product whose name best matches the query
+        actual_product_name = find_sales_product(product)
 
         # Check if data is available for the product
-        if df.empty:
+        if actual_product_name is None:
             return "No se encontró información acerca de ese producto."
 
-        # Check for stationarity
-        result = adfuller(df['sales'])
-
-        # Make the series stationary if needed
-        if result[1] > 0.05:
-            df['sales_diff'] = df['sales'].diff().dropna()
-            if df['sales_diff'].empty:
-                return "No hay suficientes datos para realizar un pronóstico."
-            data_for_model = df['sales_diff']
-        else:
-            data_for_model = df['sales']
-
-        # Fit the ARIMA model
-        model = ARIMA(data_for_model, order=(3, 1, 3))  # Modify the order based on your data analysis
-        fitted_model = model.fit()
-
         # Forecast future sales
-        forecast = round(fitted_model.forecast(steps=n_days), 0)
+        forecast = get_forecast(actual_product_name, n_days, df)
         #return f"Las ventas pronosticadas para los siguientes {n_days} días son: {forecast}"
         return forecast.round(0)
     
+    except InsufficientDataError as e:
+        return str(e)
     except FileNotFoundError:
         return "El archivo de datos no se encontró."
     except KeyError as e:
@@ -129,11 +66,10 @@ def forecast_sales2(product, n_days):
 
 def predict_inventory_depletion(product, threshold_inventory):
     try:
-        df = pd.read_excel("Abarrotes Cruz.xlsx")
+        df = load_sales_data()
         df.set_index('date', inplace=True)
 
-        pattern = f".*{product}.*"  # Regex pattern to match any substring of the product name
-        product_data = df[df['product'].str.contains(pattern, case=False, na=False)]
+        product_data = df[df['product'] == find_sales_product(product)]
 
         if product_data.empty:
             return "No se encontraron datos para el producto especificado."
@@ -150,13 +86,10 @@ def predict_inventory_depletion(product, threshold_inventory):
 
         forecasted_sales = forecast_sales2(product, 30)
         
-        days_to_depletion = 0
-        for sales in forecasted_sales:
-            current_inventory -= sales
-            days_to_depletion += 1
-            if current_inventory <= threshold_inventory:
-                depletion_date = initial_date + timedelta(days=days_to_depletion)
-                return f"Se espera que el inventario de {actual_product_name} alcance las {threshold_inventory} unidades para el {depletion_date.date()}. ¿Quieres agregar un recordatorio de compra?"
+        days_to_depletion = depletion_days([current_inventory], [np.asarray(forecasted_sales)], [threshold_inventory])[0]
+        if days_to_depletion > 0:
+            depletion_date = initial_date + timedelta(days=int(days_to_depletion))
+            return f"Se espera que el inventario de {actual_product_name} alcance las {threshold_inventory} unidades para el {depletion_date.date()}. ¿Quieres agregar un recordatorio de compra?"
 
         return "El nivel de inventario no alcanza el umbral dentro del período de pronóstico."
     
@@ -168,3 +101,61 @@ def predict_inventory_depletion(product, threshold_inventory):
         return "Datos insuficientes para realizar la operación."
     except Exception as e:
         return f"Se produjo un error inesperado: {e}"
+
+
+def products_running_out(days=7, threshold_inventory=0):
+    try:
+        df = load_sales_data()
+
+        # Latest inventory and date of every product
+        latest = df.groupby('product', sort=False).tail(1)
+        if latest.empty:
+            return "No hay información acerca de los productos."
+
+        # Only precomputed forecasts are used: fitting the whole catalog here would outlast the tool call
+        days = min(days, forecast_horizon)
+        start_dates = latest['date'] + timedelta(days=1)
+        stored = stored_forecasts(latest['product'], start_dates, days)
+        missing = sum(forecast is None for forecast in stored)
+        if missing:
+            logging.warning(f"{missing} products have no stored forecast yet; the forecast refresher fits them in the background.")
+
+        products = latest['product'].tolist()
+        inventory = latest['inventory'].tolist()
+        last_dates = latest['date'].tolist()
+        # Products without a forecast only show up when they are already at the threshold
+        forecasts = np.zeros((len(products), days))
+        for i, forecast in enumerate(stored):
+            if forecast is not None:
+                forecasts[i] = forecast
+
+        # Days until every product reaches the threshold, in one vectorized pass
+        days_left = depletion_days(inventory, forecasts, np.full(len(products), threshold_inventory))
+        running_out = sorted(
+            (int(days_left[i]), products[i], i) for i in range(len(products)) if days_left[i] >= 0
+        )
+        if not running_out:
+            if missing == len(products):
+                return "Los pronósticos de ventas todavía no están listos. Intenta de nuevo más tarde."
+            if missing:
+                return f"Ningún producto con pronóstico llegará a {threshold_inventory} unidades en los próximos {days} días ({missing} productos todavía no tienen pronóstico)."
+            return f"Ningún producto llegará a {threshold_inventory} unidades en los próximos {days} días."
+
+        lines = []
+        for day, product, i in running_out:
+            if day == 0:
+                lines.append(f"- {product}: ya tiene {inventory[i]} unidades")
+            else:
+                depletion_date = pd.Timestamp(last_dates[i]) + timedelta(days=day)
+                lines.append(f"- {product}: {depletion_date.date()}")
+        answer = f"Productos que llegarán a {threshold_inventory} unidades en los próximos {days} días:\n" + "\n".join(lines)
+        if missing:
+            answer += f"\n({missing} productos todavía no tienen pronóstico.)"
+        return answer
+
+    except KeyError as e:
+        return f"Falta una columna en los datos: {e}"
+    except ValueError as e:
+        return f"Error de valor: {e}"
+    except Exception as e:
+        return f"Se produjo un error inesperado: {e}"
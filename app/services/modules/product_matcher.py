@@ -0,0 +1,210 @@
+import os
+import re
+import math
+import logging
+import argparse
+import threading
+import unicodedata
+from functools import lru_cache
+from difflib import SequenceMatcher
+from app.services.modules.name_index import normalize_name
+from app.services.modules.catalog import get_catalog
+from app.services.modules.vectors import get_product_names, embedding_cache_stats
+
+
+# Minimum confidence for a fuzzy match to be accepted without asking the vector index
+fuzzy_threshold = float(os.environ.get("PRODUCT_MATCH_FUZZY_THRESHOLD", 0.8))
+# How far the fuzzy match must be ahead of the next candidate; closer calls go to the vector index
+fuzzy_margin = float(os.environ.get("PRODUCT_MATCH_FUZZY_MARGIN", 0.05))
+# Vector matches below this similarity are reported as unmatched (0 accepts the closest product)
+vector_threshold = float(os.environ.get("PRODUCT_MATCH_VECTOR_THRESHOLD", 0))
+
+# Confidence lost per name word missing from the query: a variant word ("Light", "Sin Azúcar",
+# a pack size) means a different product, a connector or category word ("de", "Refresco") does not
+variant_penalty = 0.1
+filler_penalty = 0.02
+filler_words = {"de", "del", "la", "el", "los", "las", "con", "en", "y", "para", "c", "u", "s"}
+
+# Quantity units as (dimension, factor to the base unit)
+units = {
+    "ml": ("volume", 1), "l": ("volume", 1000), "lt": ("volume", 1000), "lts": ("volume", 1000),
+    "litro": ("volume", 1000), "litros": ("volume", 1000),
+    "mg": ("mass", 0.001), "g": ("mass", 1), "gr": ("mass", 1), "grs": ("mass", 1),
+    "gramos": ("mass", 1), "kg": ("mass", 1000),
+    "pza": ("count", 1), "pzas": ("count", 1), "pieza": ("count", 1), "piezas": ("count", 1), "pack": ("count", 1),
+}
+quantity_pattern = re.compile(r"(\d+(?:[.,]\d+)?)\s*(" + "|".join(sorted(units, key=len, reverse=True)) + r")?\b")
+
+matcher_lock = threading.Lock()
+tier_counters = {"exact": 0, "fuzzy": 0, "vector": 0, "unmatched": 0}
+
+
+def quantities(text):
+    # Sizes in a product string as (dimension, value in base units, number as written): "1.5 l" -> ("volume", 1500.0, 1.5)
+    text = unicodedata.normalize("NFKD", str(text)).lower()
+    found = []
+    for number, unit in quantity_pattern.findall(text):
+        value = float(number.replace(",", "."))
+        if unit:
+            dimension, factor = units[unit]
+            found.append((dimension, value * factor, value))
+        else:
+            found.append((None, value, value))
+    return found
+
+
+def same_quantity(a, b):
+    # Units are compared when both sides have one, otherwise only the number as written.
+    if a[0] and b[0]:
+        return a[0] == b[0] and math.isclose(a[1], b[1])
+    return math.isclose(a[2], b[2])
+
+
+@lru_cache(maxsize=4)
+def category_words(index, min_names=10):
+    # Words that start many names ("refresco", "leche"); ticket lines often leave them out.
+    counts = {}
+    for tokens in index.tokens:
+        if tokens and not tokens[0].isdigit():
+            counts[tokens[0]] = counts.get(tokens[0], 0) + 1
+    return frozenset(word for word, count in counts.items() if count >= min_names)
+
+
+def unmentioned_words(index, query_tokens, name_tokens):
+    # Name words the query does not mention, numbers and units excluded, split into variant and filler words.
+    variants, fillers = [], []
+    categories = category_words(index)
+    for token in name_tokens:
+        if token.isdigit() or token in units:
+            continue
+        if any(token.startswith(query_token) or query_token.startswith(token) for query_token in query_tokens):
+            continue
+        if token in filler_words or token in categories:
+            fillers.append(token)
+        else:
+            variants.append(token)
+    return variants, fillers
+
+
+def fuzzy_match(index, query):
+    """
+    Best (name, confidence) among the trigram candidates, and the confidence of the runner-up.
+
+    Candidates are re-scored with an edit-distance ratio, lose confidence for every name
+    word the query does not mention and are skipped when their sizes disagree with the
+    query's: "Leche entera 1L" matches neither "1.5 l" nor a "6 pzas" pack.
+    """
+    normalized = normalize_name(query)
+    query_tokens = normalized.split()
+    query_quantities = quantities(query)
+    scored = []
+    for name, score in index.search(query, limit=5):
+        name_quantities = quantities(name)
+        if not all(any(same_quantity(q, n) for n in name_quantities) for q in query_quantities):
+            continue
+        name_tokens = normalize_name(name).split()
+        variants, fillers = unmentioned_words(index, query_tokens, name_tokens)
+        penalty = variant_penalty * len(variants) + filler_penalty * len(fillers)
+        if query_quantities:
+            # A size the query does not mention (e.g. a pack count) is a different product
+            penalty += variant_penalty * sum(not any(same_quantity(n, q) for q in query_quantities) for n in name_quantities)
+        # Filler words are already accounted for, so the edit distance ignores them
+        compared = " ".join(token for token in name_tokens if token not in fillers)
+        ratio = SequenceMatcher(None, normalized, compared, autojunk=False).ratio()
+        scored.append(((score + ratio) / 2 - penalty, name))
+    if not scored:
+        return None, 0.0, 0.0
+    scored.sort(key=lambda item: -item[0])
+    runner_up = scored[1][0] if len(scored) > 1 else 0.0
+    return scored[0][1], scored[0][0], runner_up
+
+
+def match_locally(index, query):
+    # (name, score, tier) from the exact or fuzzy tier, or None when the vector index has to decide.
+    exact = index.exact.get(normalize_name(query))
+    if exact is not None:
+        return index.names[exact], 1.0, "exact"
+    name, confidence, runner_up = fuzzy_match(index, query)
+    if name is not None and confidence >= fuzzy_threshold and confidence - runner_up >= fuzzy_margin:
+        return name, round(confidence, 4), "fuzzy"
+    return None
+
+
+def match_products(queries):
+    """
+    Resolve product strings to catalog names, cheapest tier first.
+
+    1. exact: the accent-folded, lowercased string equals a product name.
+    2. fuzzy: trigram candidates re-scored by edit distance reach `fuzzy_threshold` with a
+       `fuzzy_margin` lead over the next one, and their sizes agree with the query.
+    3. vector: the remaining strings go to get_product_names in a single batch.
+
+    Returns a (name, score, tier) tuple per query; name is None when nothing matched.
+    """
+    index = get_catalog().name_index
+    results = [None] * len(queries)
+    pending = []
+    for i, query in enumerate(queries):
+        results[i] = match_locally(index, query)
+        if results[i] is None:
+            pending.append(i)
+
+    if pending:
+        try:
+            matches = get_product_names([queries[i] for i in pending])
+        except Exception as e:
+            logging.error(f"Vector product search failed: {e}")
+            matches = [[] for _ in pending]
+        for i, candidates in zip(pending, matches):
+            if candidates and candidates[0][1] >= vector_threshold:
+                results[i] = (candidates[0][0], round(candidates[0][1], 4), "vector")
+            else:
+                results[i] = (None, 0.0, "unmatched")
+
+    with matcher_lock:
+        for _, _, tier in results:
+            tier_counters[tier] += 1
+    return results
+
+
+def matcher_stats():
+    with matcher_lock:
+        counters = dict(tier_counters)
+    total = sum(counters.values())
+    return {
+        **counters,
+        "fractions": {tier: round(count / total, 4) if total else 0.0 for tier, count in counters.items()},
+        "embeddings": embedding_cache_stats(),
+    }
+
+
+# Ticket lines as the vision model returns them, and the product the local tiers must resolve
+# them to; None means the line is ambiguous or not in the catalog and must go to the vector index.
+ocr_checks = [
+    ("Coca-Cola 600 ml", "Refresco Coca-Cola 600 ml"),
+    ("Coca-Cola Light 600ml", "Coca Cola Light 600 ml"),
+    ("Coca Cola Sin Azucar 600ml", "Coca Cola Sin Azúcar 600 ml"),
+    ("coca cola", None),
+    ("Refresco, Coca-Cola, Regular, 1l", None),
+    ("Leche Lala Entera 1L", None),
+    ("Leche Lala entera 1.5l", "Leche Lala entera 1.5 l"),
+    ("Leche, Lala, Entera, 6 pzas 1 l", "Leche Lala entera 6 pzas 1 l c/u"),
+    ("Galletas, Oreo, Chocolate, 200g", None),
+    ("Cerveza, Victoria, Oscura, 600ml", None),
+]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that sample ticket lines resolve through the exact and fuzzy tiers as expected.")
+    parser.parse_args()
+
+    index = get_catalog().name_index
+    failures = 0
+    for query, expected in ocr_checks:
+        result = match_locally(index, query)
+        name = result[0] if result else None
+        ok = name == expected
+        failures += not ok
+        print(f"{'ok' if ok else 'FAIL':4} {query!r} -> {result} (expected {expected!r})")
+    if failures:
+        raise SystemExit(f"{failures} of {len(ocr_checks)} ticket lines did not resolve as expected")
@@ -0,0 +1,80 @@
+import io
+import os
+import logging
+import pandas as pd
+from app.services.modules.blob_storage import blob_cache
+from app.services.modules.name_index import NameIndex
+from app.utils.lazy import LazyValue
+from app.utils.files import atomic_write
+
+
+blob_name_load = "Abarrotes Cruz.xlsx"
+snapshot_path = os.path.join(os.environ.get("SALES_SNAPSHOT_DIR", ".blob_cache"), "sales_data.parquet")
+
+# Parsed sales/inventory frame, the blob ETag it was parsed from and its product name index
+sales_frame = LazyValue()
+
+
+def read_snapshot(version):
+    # Columnar copy of the parsed frame, so a cold worker does not need openpyxl.
+    try:
+        with open(f"{snapshot_path}.version", "r") as version_file:
+            if version_file.read() != version:
+                return None
+        return pd.read_parquet(snapshot_path)
+    except (OSError, ValueError, ImportError):
+        return None
+
+
+def write_snapshot(df, version):
+    try:
+        with atomic_write(snapshot_path) as snapshot_file:
+            df.to_parquet(snapshot_file, index=False)
+        with atomic_write(f"{snapshot_path}.version", "w") as version_file:
+            version_file.write(version)
+    except Exception as e:
+        logging.error(f"Could not write sales data snapshot: {e}")
+
+
+def get_sales_data_version():
+    # ETag of the source blob; changes whenever Abarrotes Cruz.xlsx is updated.
+    return blob_cache.get_version(blob_name_load)
+
+
+def parse_sales_frame(version):
+    df = read_snapshot(version)
+    if df is None:
+        logging.info(f"Parsing {blob_name_load} for version {version}.")
+        df = pd.read_excel(io.BytesIO(blob_cache.get_bytes(blob_name_load)))
+        write_snapshot(df, version)
+    name_index = LazyValue(lambda _: NameIndex(df["product"].dropna().astype(str).unique()))
+    return {"version": version, "df": df, "name_index": name_index}
+
+
+def load_sales_data():
+    """
+    Return the parsed Abarrotes Cruz.xlsx frame (a copy the caller may modify).
+
+    The frame is parsed once per blob version and kept in memory. A Parquet snapshot of
+    the latest version is kept on disk for the next cold start.
+    """
+    try:
+        version = get_sales_data_version()
+        frame = sales_frame.get(
+            is_current=lambda frame: frame["version"] == version,
+            build=lambda _: parse_sales_frame(version),
+        )
+        return frame["df"].copy()
+
+    except Exception as e:
+        # Handle generic exceptions which could be related to Azure access issues, network problems, etc.
+        logging.error(f"Failed to load sales data: {e}")
+        return None
+
+
+def find_sales_product(query):
+    # Product in the sales data that best matches a free-text query, or None.
+    frame = sales_frame.value
+    if frame is None:
+        return None
+    return frame["name_index"].get().best(query)
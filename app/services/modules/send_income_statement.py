@@ -7,39 +7,13 @@ from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaFileUpload
-from azure.storage.blob import BlobServiceClient
+from app.services.modules.blob_storage import get_blob_path
 
 load_dotenv(find_dotenv())
-SAS_TOKEN = os.environ["SAS_TOKEN"]
 
-account_name = "pythonwhatsappbotstorage"
-container_name = "data"
 blob_name_load = "income_statement_visual.xlsx"
-sas_token = SAS_TOKEN
 
 
-def load_data_from_azure(account_name, container_name, blob_name, sas_token):
-    try:
-        # Create a BlobServiceClient using the SAS Token and get a client to interact with the specified blob
-        blob_service_client = BlobServiceClient(account_url=f"https://{account_name}.blob.core.windows.net", credential=sas_token)
-        blob_client = blob_service_client.get_blob_client(container=container_name, blob=blob_name)
-        
-        # Define the local path to save the file
-        local_file_path = f"./{blob_name}"
-        
-        # Download the blob to a local file
-        with open(local_file_path, "wb") as download_file:
-            download_file.write(blob_client.download_blob().readall())
-        
-        # Return the local file path instead of loading it into a DataFrame
-        return local_file_path
-
-    except Exception as e:
-        # Handle generic exceptions which could be related to Azure access issues, network problems, etc.
-        print(f"Failed to load data from Azure Blob Storage: {e}")
-        return None
-    
-
 # Define the scope of API access
 SCOPES = ['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive']
 
@@ -82,7 +56,7 @@ def get_income_statement_link():
     }
 
     try:
-        file_path = load_data_from_azure(account_name, container_name, blob_name_load, sas_token)
+        file_path = get_blob_path(blob_name_load)
         media = MediaFileUpload(file_path,
                                 mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
                                 resumable=True)
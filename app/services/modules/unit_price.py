@@ -1,41 +1,13 @@
-import os
-from dotenv import find_dotenv, load_dotenv
 import re
-import pandas as pd
-from azure.storage.blob import BlobServiceClient
+from app.services.modules.blob_storage import read_csv_blob
 
 
-load_dotenv(find_dotenv())
-SAS_TOKEN = os.environ["SAS_TOKEN"]
-
-storage_account_url = "https://pythonwhatsappbotstorage.blob.core.windows.net/"
-container_name = "data"
 blob_name = "04-2024_02.csv"
-sas_token = SAS_TOKEN
-
-
-def load_data_from_azure(storage_account_url, container_name, blob_name, sas_token):
-    try:
-        # Create a BlobServiceClient using the SAS Token and get a client to interact with the specified blob
-        blob_service_client = BlobServiceClient(account_url=storage_account_url, credential=sas_token)
-        blob_client = blob_service_client.get_blob_client(container=container_name, blob=blob_name)
-        
-        # Download the blob to a local memory stream
-        with open("unit_price_temp.csv", "wb") as download_file:
-            download_file.write(blob_client.download_blob().readall())
-        df = pd.read_csv("unit_price_temp.csv")
-
-        return df
-
-    except Exception as e:
-        # Handle generic exceptions which could be related to Azure access issues, network problems, etc.
-        print(f"Failed to load data from Azure Blob Storage: {e}")
-        return None
 
 
 def prepare_df():
     try:
-        df = load_data_from_azure(storage_account_url, container_name, blob_name, sas_token)
+        df = read_csv_blob(blob_name)
         filtered_df = df[(df['Estado'] == 'CIUDAD DE MÉXICO') & (df['Ciudad'] == 'ÁLVARO OBREGÓN')]
         df2 = filtered_df[['Producto', 'Empaque', 'Marca', 'Precio_Unitario', 'Tienda']]
         return df2
@@ -1,52 +1,248 @@
 import os
+import json
+import logging
+import argparse
+import threading
+from collections import OrderedDict
+import numpy as np
 from dotenv import find_dotenv, load_dotenv
-from pinecone import Pinecone
-from langchain_pinecone import PineconeVectorStore
 from langchain_openai import OpenAIEmbeddings
+from app.services.modules.name_index import normalize_name
+from app.utils.lazy import LazyValue
+from app.utils.files import atomic_write
 # from product_names import product_names
 
 # Load environment variables
 load_dotenv(find_dotenv())
 OPENAI_API_KEY = os.environ["OPENAI_API_KEY"]
-PINECONE_API_KEY = os.environ["PINECONE_API_KEY"]
 
+embedding_model = "text-embedding-3-small"
+# "local" searches a memory-mapped copy of the product embeddings, "pinecone" queries the hosted index
+product_match_backend = os.environ.get("PRODUCT_MATCH_BACKEND", "local")
+local_index_path = os.path.join(os.environ.get("PRODUCT_VECTORS_DIR", ".blob_cache"), "product_vectors")
 
-def create_vectors(list_of_text_chunks, index_name):
-    # Initialize Pinecone
-    pc = Pinecone(api_key=PINECONE_API_KEY)
+# Clients are created once per process instead of once per lookup
+clients = {}
+clients_lock = threading.Lock()
+
+# Query embeddings keyed by normalized product string, so items repeated across tickets are embedded once
+embedding_cache = OrderedDict()
+embedding_cache_size = int(os.environ.get("PRODUCT_EMBEDDING_CACHE_SIZE", 10000))
+embedding_cache_lock = threading.Lock()
+embedding_counters = {"hits": 0, "misses": 0, "requests": 0}
+
+
+def get_embeddings():
+    with clients_lock:
+        if "embeddings" not in clients:
+            clients["embeddings"] = OpenAIEmbeddings(
+                model=embedding_model,
+                openai_api_key=OPENAI_API_KEY
+            )
+        return clients["embeddings"]
 
-    # Set up OpenAI embeddings
-    embeddings = OpenAIEmbeddings(
-        model='text-embedding-3-small',
-        openai_api_key=OPENAI_API_KEY
-    )
+
+def get_vectorstore(index_name):
+    from langchain_pinecone import PineconeVectorStore
+    embeddings = get_embeddings()
+    with clients_lock:
+        key = ("vectorstore", index_name)
+        if key not in clients:
+            clients[key] = PineconeVectorStore(
+                index_name=index_name,
+                embedding=embeddings
+            )
+        return clients[key]
+
+
+def create_vectors(list_of_text_chunks, index_name):
+    from langchain_pinecone import PineconeVectorStore
 
     # Create vector store from texts
     PineconeVectorStore.from_texts(
         texts=list_of_text_chunks,
         index_name=index_name,
-        embedding=embeddings
+        embedding=get_embeddings()
     )
 
-def get_product_name(query, index_name='product-recognition'):
-    pc = Pinecone(api_key=PINECONE_API_KEY)
 
-    # Set up OpenAI embeddings
-    embeddings = OpenAIEmbeddings(
-        model='text-embedding-3-small',
-        openai_api_key=OPENAI_API_KEY
-    )
+class LocalVectorIndex:
+    """
+    Brute-force nearest-neighbor search over unit-normalized product embeddings.
 
-    vectorstore = PineconeVectorStore(
-        index_name=index_name,
-        embedding=embeddings
-    )
+    The embeddings live in a float32 .npy file that is memory-mapped, so workers share
+    the pages through the OS cache and a lookup is a single matrix-vector product.
+    """
+
+    def __init__(self, names, vectors, model):
+        self.names = names
+        self.vectors = vectors
+        self.model = model
+
+    def __len__(self):
+        return len(self.names)
+
+    def search(self, vector, k=1):
+        # (name, cosine similarity) of the k closest products, best first.
+        query = np.asarray(vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        scores = self.vectors @ query
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(self.names[i], float(scores[i])) for i in top]
+
+    def search_many(self, vectors, k=1):
+        # One matrix product for a batch of queries; returns a result list per query.
+        queries = np.asarray(vectors, dtype=np.float32).reshape(-1, self.vectors.shape[1])
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        scores = queries @ self.vectors.T
+        k = min(k, scores.shape[1])
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for row, candidates in zip(scores, top):
+            candidates = candidates[np.argsort(-row[candidates], kind="stable")]
+            results.append([(self.names[i], float(row[i])) for i in candidates])
+        return results
+
+    def save(self, path):
+        with atomic_write(f"{path}.npy") as vectors_file:
+            np.save(vectors_file, np.asarray(self.vectors, dtype=np.float32))
+        with atomic_write(f"{path}.json", "w") as meta_file:
+            json.dump({"model": self.model, "names": self.names}, meta_file, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path):
+        with open(f"{path}.json", "r") as meta_file:
+            meta = json.load(meta_file)
+        vectors = np.load(f"{path}.npy", mmap_mode="r")
+        if len(meta["names"]) != vectors.shape[0]:
+            raise ValueError(f"{path} has {vectors.shape[0]} vectors for {len(meta['names'])} names")
+        return cls(meta["names"], vectors, meta["model"])
+
+    @classmethod
+    def build(cls, names, batch_size=500):
+        # Embeds every name with the same model used for queries.
+        names = list(dict.fromkeys(names))
+        embeddings = get_embeddings()
+        batches = []
+        for start in range(0, len(names), batch_size):
+            batches.append(np.asarray(embeddings.embed_documents(names[start:start + batch_size]), dtype=np.float32))
+        vectors = np.vstack(batches)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return cls(names, vectors, embedding_model)
 
-    product_name = vectorstore.similarity_search(  
-        query,  # our search query  
-        k=1  # return the k most relevant docs  
+
+def build_local_index(path=local_index_path):
+    from app.services.modules.catalog import get_catalog
+    names = get_catalog().names
+    logging.info(f"Embedding {len(names)} product names for the local vector index.")
+    index = LocalVectorIndex.build(names)
+    index.save(path)
+    return index
+
+
+def load_local_index(loaded, mtime):
+    # The index is built at deploy time with `python -m app.services.modules.vectors`, never
+    # inside a request; without a usable file, vector lookups report no match.
+    from app.services.modules.catalog import get_catalog
+    if mtime is None:
+        logging.error(f"No local vector index at {local_index_path}; build it with python -m app.services.modules.vectors")
+        return {"index": None, "mtime": None}
+    try:
+        index = LocalVectorIndex.load(local_index_path)
+        if index.model != embedding_model:
+            raise ValueError(f"built with {index.model}, queries use {embedding_model}")
+        if index.names != get_catalog().names:
+            logging.warning(f"The local vector index at {local_index_path} is out of date with the catalog; rebuild it.")
+        return {"index": index, "mtime": mtime}
+    except (OSError, ValueError, KeyError) as e:
+        logging.error(f"No usable local vector index at {local_index_path}: {e}")
+    # Keep what is loaded; the file is read again once it changes
+    return {"index": loaded["index"] if loaded else None, "mtime": mtime}
+
+
+# Loaded index and the mtime of the file it was read from
+local_index = LazyValue()
+
+
+def get_local_index():
+    # Memory-mapped product index, reloaded when the CLI writes a new one. None when there is none.
+    try:
+        mtime = os.path.getmtime(f"{local_index_path}.json")
+    except OSError:
+        mtime = None
+    loaded = local_index.get(
+        is_current=lambda loaded: loaded["mtime"] == mtime,
+        build=lambda loaded: load_local_index(loaded, mtime),
     )
+    return loaded["index"]
+
+
+def embed_queries(queries):
+    # Embeddings for a batch of product strings, fetching only the uncached ones in a single request.
+    keys = [normalize_name(query) or str(query) for query in queries]
+    with embedding_cache_lock:
+        missing = []
+        for key in keys:
+            if key in embedding_cache:
+                embedding_cache.move_to_end(key)
+                embedding_counters["hits"] += 1
+            elif key not in missing:
+                missing.append(key)
+                embedding_counters["misses"] += 1
+        cached = {key: embedding_cache[key] for key in keys if key in embedding_cache}
+
+    if missing:
+        vectors = get_embeddings().embed_documents(missing)
+        with embedding_cache_lock:
+            embedding_counters["requests"] += 1
+            for key, vector in zip(missing, vectors):
+                vector = np.asarray(vector, dtype=np.float32)
+                cached[key] = vector
+                embedding_cache[key] = vector
+            while len(embedding_cache) > embedding_cache_size:
+                embedding_cache.popitem(last=False)
+    return np.vstack([cached[key] for key in keys])
+
+
+def get_product_names(queries, k=1, index_name='product-recognition'):
+    """
+    Resolve a batch of free-text product strings (e.g. every line of a ticket) at once.
+
+    All uncached strings are embedded in one request and searched together. Returns,
+    for each query, a list of up to `k` (product name, similarity score) pairs.
+    """
+    queries = list(queries)
+    if not queries:
+        return []
+
+    if product_match_backend == "pinecone":
+        vectorstore = get_vectorstore(index_name)
+        results = []
+        for vector in embed_queries(queries):
+            matches = vectorstore.similarity_search_by_vector_with_score(vector.tolist(), k=k)
+            results.append([(doc.page_content, float(score)) for doc, score in matches])
+        return results
+
+    index = get_local_index()
+    if index is None:
+        return [[] for _ in queries]
+    return index.search_many(embed_queries(queries), k=k)
+
+
+def get_product_name(query, index_name='product-recognition'):
+    return get_product_names([query], k=1, index_name=index_name)[0][0][0]
+
+
+def embedding_cache_stats():
+    with embedding_cache_lock:
+        return {**embedding_counters, "size": len(embedding_cache)}
 
-    page_contents = [doc.page_content for doc in product_name]
 
-    return page_contents[0]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the local product vector index from the product catalog.")
+    parser.add_argument("--path", default=local_index_path)
+    args = parser.parse_args()
+    index = build_local_index(args.path)
+    print(f"Saved {len(index)} product vectors to {args.path}.npy")
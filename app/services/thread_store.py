@@ -0,0 +1,113 @@
+import os
+import time
+import shelve
+import logging
+import argparse
+import threading
+
+from app.utils.sqlite import sqlite_connection
+
+
+class ThreadStore:
+    """
+    Mapping of WhatsApp IDs to OpenAI thread IDs.
+
+    Reads go through an in-memory cache and fall back to a SQLite file in WAL mode, which
+    lets every gunicorn worker read while another one writes. New mappings are written
+    immediately with INSERT OR IGNORE so two workers racing on the same user agree on a
+    single thread.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        # The file is created on first use rather than at import
+        return sqlite_connection(
+            self.path, setup=["CREATE TABLE IF NOT EXISTS threads (wa_id TEXT PRIMARY KEY, thread_id TEXT NOT NULL)"]
+        )
+
+    def get(self, wa_id):
+        thread_id = self._cache.get(wa_id)
+        if thread_id is not None:
+            return thread_id
+        row = self._connect().execute("SELECT thread_id FROM threads WHERE wa_id = ?", (wa_id,)).fetchone()
+        if row is None:
+            return None
+        with self._lock:
+            self._cache[wa_id] = row[0]
+        return row[0]
+
+    def set_many(self, items):
+        items = list(items)
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("INSERT OR REPLACE INTO threads (wa_id, thread_id) VALUES (?, ?)", items)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        with self._lock:
+            self._cache.update(items)
+        return len(items)
+
+    def is_empty(self):
+        return self._connect().execute("SELECT 1 FROM threads LIMIT 1").fetchone() is None
+
+    def get_or_create(self, wa_id, create_thread):
+        thread_id = self.get(wa_id)
+        if thread_id is not None:
+            return thread_id
+
+        new_thread_id = create_thread()
+        conn = self._connect()
+        conn.execute("INSERT OR IGNORE INTO threads (wa_id, thread_id) VALUES (?, ?)", (wa_id, new_thread_id))
+        # Another worker may have won the race, in which case its thread is used
+        thread_id = conn.execute("SELECT thread_id FROM threads WHERE wa_id = ?", (wa_id,)).fetchone()[0]
+        if thread_id != new_thread_id:
+            logging.info(f"Thread for {wa_id} was created concurrently, using {thread_id}.")
+        with self._lock:
+            self._cache[wa_id] = thread_id
+        return thread_id
+
+
+def migrate_shelve(shelve_path, store):
+    # Import every wa_id -> thread_id pair of an existing threads_db shelve.
+    start = time.perf_counter()
+    with shelve.open(shelve_path, flag="r") as threads_shelf:
+        items = [(str(wa_id), str(thread_id)) for wa_id, thread_id in threads_shelf.items()]
+    imported = store.set_many(items)
+    logging.info(f"Imported {imported} threads from {shelve_path} in {time.perf_counter() - start:.2f}s.")
+    return imported
+
+
+def migrate_if_empty(shelve_path, store):
+    # Import the legacy shelve the first time the store is used, so existing conversations are kept.
+    if not store.is_empty():
+        return 0
+    try:
+        return migrate_shelve(shelve_path, store)
+    except Exception as e:
+        logging.info(f"No threads imported from {shelve_path}: {e}")
+        return 0
+
+
+thread_store = ThreadStore(os.environ.get("THREAD_STORE_PATH", "threads.db"))
+
+
+def init_thread_store(app):
+    # Called from create_app so importing the module has no side effects on disk.
+    migrate_if_empty("threads_db", thread_store)
+    app.extensions["thread_store"] = thread_store
+    return thread_store
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Import an existing threads_db shelve into the thread store.")
+    parser.add_argument("shelve_path", nargs="?", default="threads_db")
+    args = parser.parse_args()
+    migrate_shelve(args.shelve_path, thread_store)
@@ -0,0 +1,129 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+from app.utils.sqlite import sqlite_connection
+
+
+class TTLCache:
+    # LRU set of keys that expire after `ttl` seconds. All operations are O(1).
+    def __init__(self, ttl=86400, max_entries=100000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add_if_absent(self, key):
+        # Returns True if the key was new, False if it was already seen and has not expired.
+        now = time.monotonic()
+        with self._lock:
+            seen_at = self._entries.get(key)
+            if seen_at is not None and now - seen_at < self.ttl:
+                self._entries.move_to_end(key)
+                return False
+            self._entries[key] = now
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return True
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteSeenStore:
+    # Seen keys stored in a SQLite file so duplicates are caught across gunicorn workers and restarts.
+    def __init__(self, path, ttl=86400, purge_interval=600):
+        self.path = path
+        self.ttl = ttl
+        self.purge_interval = purge_interval
+        self._last_purge = 0
+        sqlite_connection(self.path).execute(
+            "CREATE TABLE IF NOT EXISTS seen_events (key TEXT PRIMARY KEY, seen_at REAL NOT NULL)"
+        )
+
+    def add_if_absent(self, key):
+        conn = sqlite_connection(self.path)
+        now = time.time()
+        if now - self._last_purge > self.purge_interval:
+            self._last_purge = now
+            conn.execute("DELETE FROM seen_events WHERE seen_at < ?", (now - self.ttl,))
+        # The primary key makes the check-and-set atomic between processes
+        cursor = conn.execute(
+            "INSERT INTO seen_events (key, seen_at) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET seen_at = excluded.seen_at WHERE seen_at < ?",
+            (key, now, now - self.ttl),
+        )
+        return cursor.rowcount == 1
+
+    def discard(self, key):
+        sqlite_connection(self.path).execute("DELETE FROM seen_events WHERE key = ?", (key,))
+
+
+class Deduplicator:
+    """
+    Drops webhook events that were already handled.
+
+    Meta redelivers events when the webhook is slow or fails, so the same message id can
+    arrive several times. The in-memory cache answers repeated ids without touching disk;
+    the optional persistent store catches the ones first seen by another worker.
+    """
+
+    def __init__(self, memory_cache, persistent_store=None):
+        self.memory_cache = memory_cache
+        self.persistent_store = persistent_store
+        self.counters = {"unique": 0, "duplicates": 0}
+        self._lock = threading.Lock()
+
+    def is_duplicate(self, key):
+        duplicate = not self.memory_cache.add_if_absent(key)
+        if not duplicate and self.persistent_store is not None:
+            try:
+                duplicate = not self.persistent_store.add_if_absent(key)
+            except Exception as e:
+                # Prefer a possible double reply over dropping a message
+                logging.error(f"Error accessing dedup store: {e}")
+        with self._lock:
+            self.counters["duplicates" if duplicate else "unique"] += 1
+        return duplicate
+
+    def forget(self, key):
+        # Used when an event could not be accepted, so Meta's retry is not treated as a duplicate
+        self.memory_cache.discard(key)
+        if self.persistent_store is not None:
+            try:
+                self.persistent_store.discard(key)
+            except Exception as e:
+                logging.error(f"Error accessing dedup store: {e}")
+
+    def snapshot(self):
+        with self._lock:
+            counters = dict(self.counters)
+        return {**counters, "cached_keys": len(self.memory_cache)}
+
+
+def message_key(message):
+    return f"message:{message.get('id')}"
+
+
+def status_key(status):
+    # A message goes through several statuses (sent, delivered, read), each is its own event
+    return f"status:{status.get('id')}:{status.get('status')}"
+
+
+def init_deduplicator(app):
+    ttl = app.config["DEDUP_TTL_SECONDS"]
+    persistent_store = None
+    if app.config["DEDUP_BACKEND"] == "sqlite":
+        persistent_store = SQLiteSeenStore(app.config["DEDUP_PATH"], ttl=ttl)
+    deduplicator = Deduplicator(
+        TTLCache(ttl=ttl, max_entries=app.config["DEDUP_MAX_ENTRIES"]),
+        persistent_store,
+    )
+    app.extensions["deduplicator"] = deduplicator
+    return deduplicator
@@ -0,0 +1,28 @@
+import os
+import tempfile
+from contextlib import contextmanager
+
+
+# mkstemp creates files readable only by the owner; saved files keep the usual permissions
+umask = os.umask(0)
+os.umask(umask)
+
+
+@contextmanager
+def atomic_write(path, mode="wb"):
+    # Write to a temporary file of our own and move it into place, so other workers never read
+    # a partial file and concurrent writers of the same path never share a temporary file.
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        os.chmod(tmp_path, 0o666 & ~umask)
+        with os.fdopen(fd, mode) as tmp_file:
+            yield tmp_file
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,128 @@
+import os
+import json
+import time
+import random
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class GraphAPIClient:
+    """
+    Shared HTTP client for the Meta Graph API.
+
+    A single requests.Session keeps TLS connections alive between messages instead of
+    paying a new handshake per call. Reads are retried on 429 or 5xx with exponential
+    backoff, waiting longer when Meta says how long to back off through the Retry-After or
+    X-Business-Use-Case-Usage headers. Sends are only retried when Meta says the request
+    was not processed (429, or 503 with Retry-After), so a message never goes out twice.
+    """
+
+    def __init__(self, pool_size=10, max_retries=3, backoff_factor=0.5, max_backoff=60):
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session = requests.Session()
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+        self.counters = {"requests": 0, "retries": 0, "rate_limited": 0, "errors": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def retry_delay(self, response, attempt):
+        # Seconds to wait before retrying, honoring Meta's rate limit headers when present.
+        retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            try:
+                return min(float(retry_after), self.max_backoff)
+            except ValueError:
+                pass
+
+        usage = response.headers.get("X-Business-Use-Case-Usage")
+        if usage:
+            try:
+                minutes = max(
+                    entry.get("estimated_time_to_regain_access", 0)
+                    for entries in json.loads(usage).values()
+                    for entry in entries
+                )
+                if minutes:
+                    return min(minutes * 60, self.max_backoff)
+            except (ValueError, AttributeError, TypeError):
+                pass
+
+        delay = self.backoff_factor * (2 ** attempt)
+        return min(delay + random.uniform(0, delay), self.max_backoff)
+
+    def should_retry(self, method, response):
+        if method.upper() == "GET":
+            return response.status_code in RETRY_STATUSES
+        # A 5xx on a send may come after the message went out; retrying could deliver it twice
+        return response.status_code == 429 or (
+            response.status_code == 503 and "Retry-After" in response.headers
+        )
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", 10)
+        attempt = 0
+        while True:
+            self._count("requests")
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.ConnectionError:
+                # Only reads are retried on connection errors; a send may already have gone out
+                if method.upper() != "GET" or attempt >= self.max_retries:
+                    self._count("errors")
+                    raise
+                delay = min(self.backoff_factor * (2 ** attempt), self.max_backoff)
+            else:
+                if not self.should_retry(method, response) or attempt >= self.max_retries:
+                    return response
+                if response.status_code == 429:
+                    self._count("rate_limited")
+                delay = self.retry_delay(response, attempt)
+                logging.warning(f"Graph API returned {response.status_code}, retrying in {delay:.1f}s.")
+                response.close()
+
+            self._count("retries")
+            attempt += 1
+            time.sleep(delay)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def snapshot(self):
+        # Requests sent over an already open connection are counted as reused.
+        connections = 0
+        pooled_requests = 0
+        pools = self.adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                connections += pool.num_connections
+                pooled_requests += pool.num_requests
+        with self._lock:
+            counters = dict(self.counters)
+        return {
+            **counters,
+            "connections_opened": connections,
+            "connections_reused": max(0, pooled_requests - connections),
+        }
+
+
+graph_client = GraphAPIClient(
+    pool_size=int(os.environ.get("GRAPH_API_POOL_SIZE", 10)),
+    max_retries=int(os.environ.get("GRAPH_API_MAX_RETRIES", 3)),
+    backoff_factor=float(os.environ.get("GRAPH_API_BACKOFF", 0.5)),
+)
@@ -0,0 +1,32 @@
+import threading
+
+
+class LazyValue:
+    """
+    A value built on first use and shared by every thread of the process.
+
+    `get` builds it under a lock the first time, and rebuilds it whenever `is_current`
+    rejects the value held. `build` receives the value it replaces (None the first
+    time), so an update can start from the previous one. Readers never see a half-built
+    value: the new one is swapped in as a whole.
+    """
+
+    def __init__(self, build=None):
+        self.build = build
+        self.value = None
+        self._lock = threading.Lock()
+
+    def get(self, is_current=None, build=None):
+        value = self.value
+        if value is not None and (is_current is None or is_current(value)):
+            return value
+        with self._lock:
+            value = self.value
+            if value is None or (is_current is not None and not is_current(value)):
+                value = (build or self.build)(value)
+                self.value = value
+            return value
+
+    def set(self, value):
+        with self._lock:
+            self.value = value
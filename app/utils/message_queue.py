@@ -0,0 +1,286 @@
+import json
+import time
+import logging
+import threading
+from collections import deque
+
+from app.utils.sqlite import sqlite_connection
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class InMemoryBackend:
+    # Process-local FIFO queue. Jobs are lost if the worker process dies.
+    # A job is only handed out while no other job with the same key is in flight,
+    # so jobs sharing a key are processed one at a time and in order.
+    def __init__(self, maxsize=0):
+        self.maxsize = maxsize
+        self._jobs = deque()
+        self._in_flight = set()
+        self._condition = threading.Condition()
+
+    def put(self, job):
+        with self._condition:
+            if self.maxsize and len(self._jobs) >= self.maxsize:
+                raise QueueFullError("Message queue is full")
+            self._jobs.append(job)
+            self._condition.notify()
+
+    def _claim(self):
+        for i, job in enumerate(self._jobs):
+            key = job.get("key")
+            if key is None or key not in self._in_flight:
+                del self._jobs[i]
+                if key is not None:
+                    self._in_flight.add(key)
+                return job
+        return None
+
+    def get(self, timeout):
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                job = self._claim()
+                if job is not None:
+                    return job
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+
+    def ack(self, job):
+        with self._condition:
+            self._in_flight.discard(job.get("key"))
+            self._condition.notify_all()
+
+    def depth(self):
+        with self._condition:
+            return len(self._jobs)
+
+
+class SQLiteBackend:
+    # Persistent queue stored in a SQLite file. Jobs survive restarts and can be shared
+    # by every gunicorn worker pointing at the same file. Jobs sharing a key are never
+    # claimed while an earlier one is still in flight, in any process.
+    def __init__(self, path, maxsize=0, poll_interval=0.2, lease_seconds=300):
+        self.path = path
+        self.maxsize = maxsize
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self._wakeup = threading.Event()
+        with sqlite_connection(self.path) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "kind TEXT NOT NULL, "
+                "job_key TEXT, "
+                "payload TEXT NOT NULL, "
+                "enqueued_at REAL NOT NULL, "
+                "claimed_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_claimed ON jobs (claimed_at, job_key)")
+
+    def put(self, job):
+        conn = sqlite_connection(self.path)
+        if self.maxsize and self.depth() >= self.maxsize:
+            raise QueueFullError("Message queue is full")
+        conn.execute(
+            "INSERT INTO jobs (kind, job_key, payload, enqueued_at) VALUES (?, ?, ?, ?)",
+            (job["kind"], job.get("key"), json.dumps(job["body"]), job["enqueued_at"]),
+        )
+        self._wakeup.set()
+
+    def _claim(self):
+        conn = sqlite_connection(self.path)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Jobs claimed by a worker that died are handed out again once their lease expires
+            conn.execute(
+                "UPDATE jobs SET claimed_at = NULL WHERE claimed_at < ?",
+                (time.time() - self.lease_seconds,),
+            )
+            # The oldest eligible job is always the oldest one of its key
+            row = conn.execute(
+                "SELECT id, kind, job_key, payload, enqueued_at FROM jobs "
+                "WHERE claimed_at IS NULL AND (job_key IS NULL OR job_key NOT IN "
+                "(SELECT job_key FROM jobs WHERE claimed_at IS NOT NULL AND job_key IS NOT NULL)) "
+                "ORDER BY id LIMIT 1"
+            ).fetchone()
+            if row:
+                conn.execute("UPDATE jobs SET claimed_at = ? WHERE id = ?", (time.time(), row[0]))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if row is None:
+            return None
+        return {"id": row[0], "kind": row[1], "key": row[2], "body": json.loads(row[3]), "enqueued_at": row[4]}
+
+    def get(self, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self._claim()
+            if job is not None:
+                return job
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            # Local puts and acks wake us immediately; jobs from other processes are picked up on the next poll
+            self._wakeup.wait(min(self.poll_interval, remaining))
+            self._wakeup.clear()
+
+    def ack(self, job):
+        sqlite_connection(self.path).execute("DELETE FROM jobs WHERE id = ?", (job["id"],))
+        self._wakeup.set()
+
+    def depth(self):
+        row = sqlite_connection(self.path).execute("SELECT COUNT(*) FROM jobs WHERE claimed_at IS NULL").fetchone()
+        return row[0]
+
+
+class LatencyStats:
+    # Rolling latency statistics (in milliseconds) over the most recent samples.
+    def __init__(self, window=500):
+        self._samples = deque(maxlen=window)
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds * 1000)
+            self._count += 1
+
+    def snapshot(self):
+        with self._lock:
+            samples = sorted(self._samples)
+            count = self._count
+        if not samples:
+            return {"count": count, "avg_ms": None, "p50_ms": None, "p95_ms": None, "max_ms": None}
+        return {
+            "count": count,
+            "avg_ms": round(sum(samples) / len(samples), 2),
+            "p50_ms": round(samples[len(samples) // 2], 2),
+            "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 2),
+            "max_ms": round(samples[-1], 2),
+        }
+
+
+class MessageQueue:
+    """
+    Bounded pool of worker threads draining a queue of webhook jobs.
+
+    The webhook only validates and enqueues, so the HTTP 200 goes back to Meta right away
+    while the assistant run, tool calls and replies happen in the background. Each job is
+    a dict with a `kind` used to pick the handler, the `body` passed to it and an optional
+    ordering `key`: jobs with the same key run one at a time in enqueue order, jobs with
+    different keys run concurrently.
+    """
+
+    def __init__(self, app, backend, handlers, workers=4):
+        self.app = app
+        self.backend = backend
+        self.handlers = handlers
+        self.workers = workers
+        self.stats = {
+            "enqueue": LatencyStats(),
+            "queue_wait": LatencyStats(),
+            "process": LatencyStats(),
+        }
+        self.counters = {"enqueued": 0, "processed": 0, "failed": 0, "rejected": 0}
+        self._counters_lock = threading.Lock()
+        self._threads = []
+        self._stopping = threading.Event()
+
+    def _count(self, name):
+        with self._counters_lock:
+            self.counters[name] += 1
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"message-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logging.info(f"Message queue started with {self.workers} workers ({type(self.backend).__name__}).")
+
+    def stop(self, timeout=5):
+        self._stopping.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def enqueue(self, kind, body, key=None):
+        started = time.perf_counter()
+        job = {"kind": kind, "key": key, "body": body, "enqueued_at": time.time()}
+        try:
+            self.backend.put(job)
+        except QueueFullError:
+            self._count("rejected")
+            raise
+        self._count("enqueued")
+        self.stats["enqueue"].add(time.perf_counter() - started)
+
+    def _work(self):
+        while not self._stopping.is_set():
+            try:
+                job = self.backend.get(timeout=1)
+            except Exception as e:
+                logging.error(f"Error reading from message queue: {e}")
+                time.sleep(1)
+                continue
+            if job is None:
+                continue
+
+            self.stats["queue_wait"].add(max(0.0, time.time() - job["enqueued_at"]))
+            handler = self.handlers.get(job["kind"])
+            started = time.perf_counter()
+            try:
+                if handler is None:
+                    logging.error(f"No handler registered for job kind: {job['kind']}")
+                else:
+                    # Handlers rely on current_app, so every job runs inside an app context
+                    with self.app.app_context():
+                        handler(job["body"])
+                self._count("processed")
+            except Exception as e:
+                self._count("failed")
+                logging.error(f"Error processing {job['kind']} job: {e}")
+            finally:
+                self.stats["process"].add(time.perf_counter() - started)
+                try:
+                    self.backend.ack(job)
+                except Exception as e:
+                    logging.error(f"Error acknowledging job: {e}")
+
+    def snapshot(self):
+        with self._counters_lock:
+            counters = dict(self.counters)
+        return {
+            "backend": type(self.backend).__name__,
+            "workers": self.workers,
+            "depth": self.backend.depth(),
+            **counters,
+            "latency": {stage: stats.snapshot() for stage, stats in self.stats.items()},
+        }
+
+
+def create_backend(config):
+    backend = config["MESSAGE_QUEUE_BACKEND"]
+    maxsize = config["MESSAGE_QUEUE_MAXSIZE"]
+    if backend == "sqlite":
+        return SQLiteBackend(config["MESSAGE_QUEUE_PATH"], maxsize=maxsize)
+    if backend == "memory":
+        return InMemoryBackend(maxsize=maxsize)
+    raise ValueError(f"Unknown message queue backend: {backend}")
+
+
+def init_message_queue(app, handlers):
+    message_queue = MessageQueue(
+        app,
+        create_backend(app.config),
+        handlers,
+        workers=app.config["MESSAGE_QUEUE_WORKERS"],
+    )
+    message_queue.start()
+    app.extensions["message_queue"] = message_queue
+    return message_queue
@@ -0,0 +1,22 @@
+import sqlite3
+import threading
+
+
+_local = threading.local()
+
+
+def sqlite_connection(path, setup=()):
+    # One autocommit connection per thread and file, in WAL mode so every gunicorn worker can
+    # read while another one writes. `setup` statements run once, when the connection opens.
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(path)
+    if conn is None:
+        conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        for statement in setup:
+            conn.execute(statement)
+        connections[path] = conn
+    return conn
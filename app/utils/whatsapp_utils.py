@@ -1,10 +1,13 @@
+import io
 import logging
+import tempfile
 from flask import current_app, jsonify
 import json
 import requests
 import re
+from app.utils.graph_api import graph_client
 from app.services.basic_assistant import generate_response
-from app.services.image_assistant import generate_image_response, echo_text
+from app.services.image_assistant import generate_image_response, add_to_thread_history
 
 
 def log_http_response(response):
@@ -34,7 +37,7 @@ def send_message(data):
     url = f"https://graph.facebook.com/{current_app.config['VERSION']}/{current_app.config['PHONE_NUMBER_ID']}/messages"
 
     try:
-        response = requests.post(
+        response = graph_client.post(
             url, data=data, headers=headers, timeout=10
         )  # 10 seconds timeout as an example
         response.raise_for_status()  # Raises an HTTPError if the HTTP request returned an unsuccessful status code
@@ -58,7 +61,7 @@ def get_media_url(media_id):
         "Authorization": f"Bearer {current_app.config['ACCESS_TOKEN']}"
     }
     
-    response = requests.get(url, headers=headers)
+    response = graph_client.get(url, headers=headers)
     if response.status_code == 200:
         media_data = response.json()
         return media_data.get('url')
@@ -67,23 +70,52 @@ def get_media_url(media_id):
         return None
 
 
-def download_image(image_url, image_id):
-    path_to_save = f"{image_id}.jpg"  # Temporary file path
+def download_image(image_url):
+    """
+    Stream a media file into memory and return it as a file object positioned at the start.
 
+    Files larger than MEDIA_MAX_BYTES are rejected. When MEDIA_SPOOL_BYTES is set below that
+    limit, larger files are moved to an anonymous temporary file, which the OS removes when
+    it is closed. The caller must close the returned object. Returns None if the download failed.
+    """
+    max_bytes = current_app.config["MEDIA_MAX_BYTES"]
+    spool_bytes = current_app.config["MEDIA_SPOOL_BYTES"]
     headers = {
         "Authorization": f"Bearer {current_app.config['ACCESS_TOKEN']}"
     }
 
     # Download the image with the appropriate headers
-    response = requests.get(image_url, headers=headers, stream=True)
-    if response.status_code == 200:
-        with open(path_to_save, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
-        return path_to_save
-    else:
-        logging.error(f"Failed to download the image: {response.text}")
-        return None
+    with graph_client.get(image_url, headers=headers, stream=True) as response:
+        if response.status_code != 200:
+            logging.error(f"Failed to download the image: {response.text}")
+            return None
+
+        content_length = int(response.headers.get("Content-Length") or 0)
+        if content_length > max_bytes:
+            logging.error(f"Image of {content_length} bytes exceeds the {max_bytes} byte limit.")
+            return None
+
+        buffer = io.BytesIO()
+        size = 0
+        try:
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                size += len(chunk)
+                if size > max_bytes:
+                    logging.error(f"Image exceeds the {max_bytes} byte limit, download aborted.")
+                    buffer.close()
+                    return None
+                if size > spool_bytes and isinstance(buffer, io.BytesIO):
+                    spilled = tempfile.TemporaryFile()
+                    spilled.write(buffer.getbuffer())
+                    buffer.close()
+                    buffer = spilled
+                buffer.write(chunk)
+        except Exception:
+            buffer.close()
+            raise
+
+    buffer.seek(0)
+    return buffer
 
 
 def process_text_for_whatsapp(text):
@@ -104,11 +136,11 @@ def process_text_for_whatsapp(text):
     return whatsapp_style_text
 
 
-def process_whatsapp_message(body):
-    wa_id = body["entry"][0]["changes"][0]["value"]["contacts"][0]["wa_id"]
-    name = body["entry"][0]["changes"][0]["value"]["contacts"][0]["profile"]["name"]
+def process_whatsapp_message(event):
+    wa_id = event["wa_id"]
+    name = event["name"]
 
-    message = body["entry"][0]["changes"][0]["value"]["messages"][0]
+    message = event["message"]
     message_body = message["text"]["body"]
 
     # OpenAI Integration
@@ -119,25 +151,26 @@ def process_whatsapp_message(body):
     send_message(data)
 
 
-def process_image_message(body):
-    message = body["entry"][0]["changes"][0]["value"]["messages"][0]
-    wa_id = body["entry"][0]["changes"][0]["value"]["contacts"][0]["wa_id"]
+def process_image_message(event):
+    message = event["message"]
+    wa_id = event["wa_id"]
     image_info = message.get("image", {})
     image_id = image_info.get('id')
 
     if image_id:
         image_url = get_media_url(image_id)  # Assume get_media_url returns the URL and MIME type
         if image_url:
-            image_path = download_image(image_url, image_id)
-            if image_path:
-                response_text = generate_image_response(image_path, wa_id, image_id)
+            image_file = download_image(image_url)
+            if image_file:
+                with image_file:
+                    response_text = generate_image_response(image_file, wa_id, image_id)
                 response_text = process_text_for_whatsapp(response_text)
 
                 # Preparing and sending the message back to WhatsApp
                 data = get_text_message_input(current_app.config["RECIPIENT_WAID"], response_text)
                 send_message(data)
 
-                echo_text(response_text, wa_id)
+                add_to_thread_history(response_text, wa_id)
             else:
                 logging.error("Failed to download image.")
         else:
@@ -146,15 +179,35 @@ def process_image_message(body):
         logging.error("Image ID not found in the message.")
 
 
-def is_valid_whatsapp_message(body):
+def iter_webhook_events(body):
     """
-    Check if the incoming webhook event has a valid WhatsApp message structure.
+    Walk every entry, change, message and status of a webhook payload in a single pass.
+
+    Meta batches several messages and statuses into one request under load. Each message
+    is yielded as {"type": "message", "wa_id", "name", "message"} and each delivery status
+    as {"type": "status", "wa_id", "status"}, in the order they appear in the payload.
     """
-    return (
-        body.get("object")
-        and body.get("entry")
-        and body["entry"][0].get("changes")
-        and body["entry"][0]["changes"][0].get("value")
-        and body["entry"][0]["changes"][0]["value"].get("messages")
-        and body["entry"][0]["changes"][0]["value"]["messages"][0]
-    )
+    for entry in body.get("entry") or []:
+        for change in entry.get("changes") or []:
+            value = change.get("value") or {}
+            contacts = value.get("contacts") or []
+            contacts_by_wa_id = {contact.get("wa_id"): contact for contact in contacts}
+
+            for message in value.get("messages") or []:
+                contact = contacts_by_wa_id.get(message.get("from"))
+                if contact is None and len(contacts) == 1:
+                    contact = contacts[0]
+                contact = contact or {}
+                yield {
+                    "type": "message",
+                    "wa_id": contact.get("wa_id", message.get("from")),
+                    "name": contact.get("profile", {}).get("name"),
+                    "message": message,
+                }
+
+            for status in value.get("statuses") or []:
+                yield {
+                    "type": "status",
+                    "wa_id": status.get("recipient_id"),
+                    "status": status,
+                }
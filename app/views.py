@@ -3,12 +3,13 @@ import json
 
 from flask import Blueprint, request, jsonify, current_app
 
-from .decorators.security import signature_required
-from .utils.whatsapp_utils import (
-    process_whatsapp_message,
-    process_image_message,
-    is_valid_whatsapp_message,
-)
+from .decorators.security import signature_required, stats_token_required
+from .utils.whatsapp_utils import iter_webhook_events
+from .utils.message_queue import QueueFullError
+from .utils.dedup import message_key, status_key
+from .utils.graph_api import graph_client
+from .services.modules.blob_storage import blob_cache
+from .services.modules.product_matcher import matcher_stats
 
 webhook_blueprint = Blueprint("webhook", __name__)
 
@@ -18,9 +19,10 @@ def handle_message():
     Handle incoming webhook events from the WhatsApp API.
 
     This function processes incoming WhatsApp messages and other events,
-    such as delivery statuses. If the event is a valid message, it gets
-    processed. If the incoming payload is not a recognized WhatsApp event,
-    an error is returned.
+    such as delivery statuses. Meta may batch several messages and statuses
+    into one request, so every entry and change is walked. Valid messages get
+    enqueued for the background workers and acknowledged right away. If the
+    incoming payload is not a recognized WhatsApp event, an error is returned.
 
     Every message send will trigger 4 HTTP requests to your webhook: message, sent, delivered, read.
 
@@ -30,35 +32,63 @@ def handle_message():
     body = request.get_json()
     logging.info(f"request body: {body}")
 
-    # Check if it's a WhatsApp status update
-    if (
-        body.get("entry", [{}])[0]
-        .get("changes", [{}])[0]
-        .get("value", {})
-        .get("statuses")
-    ):
-        logging.info("Received a WhatsApp status update.")
-        return jsonify({"status": "ok"}), 200
+    deduplicator = current_app.extensions["deduplicator"]
+    message_queue = current_app.extensions["message_queue"]
 
+    if not body.get("object"):
+        return (
+            jsonify({"status": "error", "message": "Not a WhatsApp API event"}),
+            404,
+        )
+
+    counts = {"messages": 0, "statuses": 0, "duplicates": 0, "unsupported": 0}
+    accepted_keys = []
     try:
-        if is_valid_whatsapp_message(body):
-            message = body["entry"][0]["changes"][0]["value"]["messages"][0]
+        for event in iter_webhook_events(body):
+            if event["type"] == "status":
+                counts["statuses"] += 1
+                if deduplicator.is_duplicate(status_key(event["status"])):
+                    counts["duplicates"] += 1
+                continue
+
+            counts["messages"] += 1
+            message = event["message"]
+            key = message_key(message)
+            if deduplicator.is_duplicate(key):
+                logging.info(f"Ignoring duplicate message {message.get('id')}")
+                counts["duplicates"] += 1
+                continue
+            accepted_keys.append(key)
+
+            # Jobs are keyed on wa_id so messages from one user are processed in order
             if 'text' in message:
-                process_whatsapp_message(body)
+                message_queue.enqueue("text", event, key=event["wa_id"])
             elif 'image' in message:
-                process_image_message(body)
+                message_queue.enqueue("image", event, key=event["wa_id"])
             else:
+                counts["unsupported"] += 1
                 logging.info("Unsupported message type")
-            return jsonify({"status": "ok"}), 200
-        else:
-            return (
-                jsonify({"status": "error", "message": "Not a WhatsApp API event"}),
-                404,
-            )
+    except QueueFullError:
+        # Meta retries the whole request on non-2xx responses; messages already
+        # enqueued are dropped as duplicates, the rest are accepted on retry
+        deduplicator.forget(accepted_keys[-1])
+        logging.error("Message queue is full, rejecting webhook event")
+        return jsonify({"status": "error", "message": "Server busy"}), 503
     except json.JSONDecodeError:
         logging.error("Failed to decode JSON")
         return jsonify({"status": "error", "message": "Invalid JSON provided"}), 400
 
+    logging.info(
+        f"Webhook carried {counts['messages']} messages and {counts['statuses']} statuses "
+        f"({counts['duplicates']} duplicates)."
+    )
+    if not counts["messages"] and not counts["statuses"]:
+        return (
+            jsonify({"status": "error", "message": "Not a WhatsApp API event"}),
+            404,
+        )
+    return jsonify({"status": "ok", "events": counts}), 200
+
 
 # Required webhook verifictaion for WhatsApp
 def verify():
@@ -93,3 +123,12 @@ def webhook_post():
     return handle_message()
 
 
+@webhook_blueprint.route("/queue/stats", methods=["GET"])
+@stats_token_required
+def queue_stats():
+    stats = current_app.extensions["message_queue"].snapshot()
+    stats["dedup"] = current_app.extensions["deduplicator"].snapshot()
+    stats["graph_api"] = graph_client.snapshot()
+    stats["blob_cache"] = blob_cache.snapshot()
+    stats["product_matching"] = matcher_stats()
+    return jsonify(stats), 200
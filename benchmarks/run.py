@@ -0,0 +1,278 @@
+"""
+Benchmarks of the vectorized data paths against the loops they replaced.
+
+Run from the repository root, one benchmark per subcommand:
+
+    python -m benchmarks.run cooccurrence --transactions 200000
+
+Each benchmark generates synthetic data, checks that both implementations agree and
+prints their timings. The reference loops below are kept here, not in the app.
+"""
+import os
+import re
+import time
+import random
+import argparse
+import numpy as np
+import pandas as pd
+
+
+def networkx_cooccurrence(baskets):
+    # The pairwise loop recommend_products_for used to run.
+    import networkx as nx
+    graph = nx.Graph()
+    for transaction in baskets:
+        for i in range(len(transaction)):
+            for j in range(i + 1, len(transaction)):
+                if graph.has_edge(transaction[i], transaction[j]):
+                    graph[transaction[i]][transaction[j]]['weight'] += 1
+                else:
+                    graph.add_edge(transaction[i], transaction[j], weight=1)
+    return graph
+
+
+def synthetic_transactions(n_transactions, n_items, max_basket_size=8, seed=0):
+    rng = random.Random(seed)
+    items = [f"Producto {i}" for i in range(n_items)]
+    # Skewed popularity, like real baskets where a few products appear in most tickets
+    weights = [1 / (rank + 1) for rank in range(n_items)]
+    baskets = []
+    for _ in range(n_transactions):
+        basket = dict.fromkeys(rng.choices(items, weights=weights, k=rng.randint(1, max_basket_size)))
+        baskets.append(list(basket))
+    return pd.DataFrame(baskets)
+
+
+def benchmark_cooccurrence(args):
+    from app.services.modules.cooccurrence import encode_transactions, cooccurrence_counts
+
+    df = synthetic_transactions(args.transactions, args.items, args.max_basket_size)
+    baskets = [[item for item in row if not pd.isna(item)] for row in df.itertuples(index=False)]
+
+    start = time.perf_counter()
+    graph = networkx_cooccurrence(baskets)
+    networkx_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    transactions, item_ids = encode_transactions(df)
+    counts = cooccurrence_counts(transactions).tocoo()
+    vectorized_time = time.perf_counter() - start
+
+    # Both approaches must find the same weighted edges
+    names = {i: item for item, i in item_ids.items()}
+    upper = counts.row < counts.col
+    edges = {
+        frozenset((names[i], names[j])): weight
+        for i, j, weight in zip(counts.row[upper], counts.col[upper], counts.data[upper])
+    }
+    expected = {frozenset((u, v)): data["weight"] for u, v, data in graph.edges(data=True)}
+    assert edges == expected, "Co-occurrence counts differ from the networkx loop"
+
+    print(f"{args.transactions} transactions, {args.items} items, {len(expected)} edges")
+    print(f"networkx loop: {networkx_time:.3f}s")
+    print(f"sparse product: {vectorized_time:.3f}s ({networkx_time / vectorized_time:.1f}x faster)")
+
+
+def regex_scan(query, names):
+    # The first name containing the query, as the tools used to do.
+    pattern = re.compile(re.escape(query), re.IGNORECASE)
+    for name in names:
+        if pattern.search(name):
+            return name
+    return None
+
+
+def sample_queries(names, n_queries, seed=0):
+    # Queries like the ones users type: a couple of words of a name, sometimes without accents.
+    from app.services.modules.name_index import normalize_name
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(n_queries):
+        words = rng.choice(names).split()
+        start = rng.randrange(len(words))
+        query = " ".join(words[start:start + rng.randint(1, 3)])
+        if rng.random() < 0.5:
+            query = normalize_name(query)
+        queries.append(query)
+    return queries
+
+
+def benchmark_name_index(args):
+    from app.services.modules.name_index import NameIndex
+    from app.services.modules.products_dictionary import products_dictionary
+
+    names = list(products_dictionary)
+    queries = sample_queries(names, args.queries)
+
+    start = time.perf_counter()
+    index = NameIndex(names)
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    scan_hits = sum(regex_scan(query, names) is not None for query in queries)
+    scan_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index_hits = sum(bool(index.search(query)) for query in queries)
+    index_time = time.perf_counter() - start
+
+    print(f"{len(names)} names, {args.queries} queries, index built in {build_time * 1000:.1f} ms")
+    print(f"regex scan: {scan_time / args.queries * 1000:.3f} ms/query, {scan_hits} matched")
+    print(f"trigram index: {index_time / args.queries * 1000:.3f} ms/query, {index_hits} matched")
+
+
+def depletion_days_loop(inventory, forecasts, thresholds):
+    # The day-by-day loop predict_inventory_depletion used to run.
+    days = np.full(np.shape(thresholds), -1)
+    for i, threshold in np.ndenumerate(thresholds):
+        product = i[0]
+        current_inventory = inventory[product]
+        if current_inventory <= threshold:
+            days[i] = 0
+            continue
+        for day, sales in enumerate(forecasts[product], 1):
+            current_inventory -= sales
+            if current_inventory <= threshold:
+                days[i] = day
+                break
+    return days
+
+
+def benchmark_depletion(args):
+    from app.services.modules.depletion import depletion_days
+
+    rng = np.random.default_rng(0)
+    # Fitted forecasts can dip below zero (returns, model noise), so include some negative days
+    forecasts = rng.gamma(2.0, 5.0, (args.products, args.horizon)) - rng.exponential(4.0, (args.products, args.horizon))
+    inventory = rng.uniform(0, 400, args.products)
+    thresholds = rng.uniform(0, 100, (args.products, args.thresholds))
+
+    start = time.perf_counter()
+    expected = depletion_days_loop(inventory, forecasts, thresholds)
+    loop_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    days = depletion_days(inventory, forecasts, thresholds)
+    vectorized_time = time.perf_counter() - start
+
+    assert np.array_equal(days, expected), "Vectorized depletion days differ from the loop"
+    print(f"{args.products} products x {args.thresholds} thresholds, {args.horizon}-day forecasts")
+    print(f"python loop: {loop_time:.3f}s")
+    print(f"cumsum + searchsorted: {vectorized_time:.4f}s ({loop_time / vectorized_time:.0f}x faster)")
+
+
+def rop_loop(df, lead_times, interest_rate=0.115, ordering_cost_factor=0.48, service_level=1.65):
+    # The per-product filter loop check_all_products_rop used to run.
+    rows = {}
+    for product_name in df['product'].unique():
+        product_df = df[df['product'] == product_name]
+        lead_time = lead_times.get(product_name, np.nan)
+        non_zero_costs = product_df['cost'][product_df['cost'] > 0]
+        cost_per_unit = non_zero_costs.mean() if not non_zero_costs.empty else 0
+        non_zero_purchases = product_df['purchases'][product_df['purchases'] > 0]
+        purchase_quantity = non_zero_purchases.mean() if not non_zero_purchases.empty else 0
+        ordering_cost = cost_per_unit * purchase_quantity * ordering_cost_factor
+        sales_average = product_df['sales'].mean()
+        safety_stock = service_level * product_df['sales'].std()
+        holding_cost_per_unit = cost_per_unit * interest_rate
+        eoq = round(np.sqrt((2 * sales_average * ordering_cost) / holding_cost_per_unit) if holding_cost_per_unit > 0 else 15, 0)
+        rop = round((sales_average * lead_time) + safety_stock, 0)
+        rows[product_name] = (eoq, rop, product_df.iloc[-1]['inventory'])
+    return pd.DataFrame.from_dict(rows, orient='index', columns=['eoq', 'rop', 'current_inventory'])
+
+
+def synthetic_inventory(n_products, n_days, seed=0):
+    rng = np.random.default_rng(seed)
+    n_rows = n_products * n_days
+    return pd.DataFrame({
+        'date': np.tile(pd.date_range("2024-01-01", periods=n_days, freq="D"), n_products),
+        'product': np.repeat([f"Producto {i}" for i in range(n_products)], n_days),
+        'sales': rng.poisson(10, n_rows).astype(float),
+        'inventory': rng.integers(0, 200, n_rows).astype(float),
+        'cost': np.where(rng.random(n_rows) < 0.2, rng.uniform(5, 50, n_rows), 0),
+        'purchases': np.where(rng.random(n_rows) < 0.1, rng.integers(10, 100, n_rows), 0).astype(float),
+    })
+
+
+def benchmark_inventory_metrics(args):
+    from app.services.modules.inventory_metrics import compute_inventory_metrics
+
+    df = synthetic_inventory(args.products, args.days)
+    lead_times = pd.Series({f"Producto {i}": float(i % 10 + 1) for i in range(0, args.products, 2)})
+
+    start = time.perf_counter()
+    expected = rop_loop(df, lead_times)
+    loop_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    metrics = compute_inventory_metrics(df, lead_times)
+    vectorized_time = time.perf_counter() - start
+
+    columns = ['eoq', 'rop', 'current_inventory']
+    pd.testing.assert_frame_equal(metrics[columns], expected[columns], check_names=False)
+    print(f"{args.products} products x {args.days} days ({len(df)} rows)")
+    print(f"per-product filter loop: {loop_time:.2f}s")
+    print(f"single groupby: {vectorized_time:.3f}s ({loop_time / vectorized_time:.0f}x faster)")
+
+
+def synthetic_sales(n_products, n_days, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range("2024-01-01", periods=n_days, freq="D")
+    days = np.arange(n_days)
+    frames = []
+    for i in range(n_products):
+        sales = 20 + 5 * np.sin(days / 7 + i) + rng.normal(0, 2, n_days)
+        frames.append(pd.DataFrame({"date": dates, "product": f"Producto {i}", "sales": sales.round()}))
+    return pd.concat(frames, ignore_index=True)
+
+
+def benchmark_forecasts(args):
+    # Wall time of forecast_all on synthetic data with 1, 2, 4, ... workers.
+    from app.services.modules.forecast_store import forecast_all
+
+    df = synthetic_sales(args.products, args.days)
+    max_workers = args.workers or os.cpu_count() or 1
+    counts = sorted({min(2 ** i, max_workers) for i in range(max_workers.bit_length() + 1)})
+    baseline = None
+    print(f"{args.products} products x {args.days} days")
+    for workers in counts:
+        start = time.perf_counter()
+        results, failures = forecast_all(df, workers=workers, progress=None)
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        print(f"{workers} workers: {elapsed:.2f}s ({baseline / elapsed:.1f}x), {len(results)} fitted, {len(failures)} failed")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the vectorized data paths against the loops they replaced.")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    cooccurrence = subparsers.add_parser("cooccurrence", help="networkx co-occurrence loop vs the sparse product")
+    cooccurrence.add_argument("--transactions", type=int, default=50000)
+    cooccurrence.add_argument("--items", type=int, default=2000)
+    cooccurrence.add_argument("--max-basket-size", type=int, default=8)
+    cooccurrence.set_defaults(run=benchmark_cooccurrence)
+
+    name_index = subparsers.add_parser("name-index", help="regex scan vs the trigram name index")
+    name_index.add_argument("--queries", type=int, default=2000)
+    name_index.set_defaults(run=benchmark_name_index)
+
+    depletion = subparsers.add_parser("depletion", help="day-by-day depletion loop vs cumsum + searchsorted")
+    depletion.add_argument("--products", type=int, default=5000)
+    depletion.add_argument("--horizon", type=int, default=30)
+    depletion.add_argument("--thresholds", type=int, default=4)
+    depletion.set_defaults(run=benchmark_depletion)
+
+    inventory_metrics = subparsers.add_parser("inventory-metrics", help="per-product ROP loop vs the single groupby")
+    inventory_metrics.add_argument("--products", type=int, default=10000)
+    inventory_metrics.add_argument("--days", type=int, default=30)
+    inventory_metrics.set_defaults(run=benchmark_inventory_metrics)
+
+    forecasts = subparsers.add_parser("forecasts", help="forecast_all wall time with 1, 2, 4, ... worker processes")
+    forecasts.add_argument("--products", type=int, default=64)
+    forecasts.add_argument("--days", type=int, default=365)
+    forecasts.add_argument("--workers", type=int, default=None)
+    forecasts.set_defaults(run=benchmark_forecasts)
+
+    args = parser.parse_args()
+    args.run(args)